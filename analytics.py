@@ -0,0 +1,289 @@
+import json
+import math
+import time
+import asyncio
+import logging
+import threading
+from sqlite_db import open_db
+
+logger = logging.getLogger(__name__)
+
+# Шаги воронки по порядку: ключ -> подпись в /stats
+FUNNEL_STEPS = (
+    ("start", "👋 /start"),
+    ("services", "📊 Услуги"),
+    ("portfolio", "🖥 Портфолио"),
+    ("order_menu", "🛒 Заказать"),
+    ("order_form", "📝 Выбрана услуга"),
+    ("order_done", "✅ Заказ оформлен"),
+    ("order_cancel", "❌ Заказ отменен"),
+)
+
+# Окна: имя -> (длительность корзины в секундах, число корзин)
+WINDOWS = {
+    "1h": (60, 60),
+    "24h": (3600, 24),
+    "7d": (3600, 168),
+}
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(value):
+    """splitmix64: равномерный 64-битный хэш для целых id пользователей"""
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+class HyperLogLog:
+    """Приближенный подсчет уникальных пользователей: 2**precision байт, ошибка ~1.04/sqrt(2**precision)"""
+
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision=10, registers=None):
+        self.precision = precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(1 << precision)
+
+    def add(self, user_id):
+        self.add_hash(_mix64(user_id))
+
+    def add_hash(self, hashed):
+        index = hashed >> (64 - self.precision)
+        rest = (hashed << self.precision) & _MASK64
+        rank = 64 - self.precision + 1 if rest == 0 else 65 - rest.bit_length()
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """Объединение (максимум по регистрам) в новый экземпляр"""
+        return HyperLogLog(self.precision, bytes(map(max, self.registers, other.registers)))
+
+    def count(self):
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(_INVERSE_POWERS[rank] for rank in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            # Поправка для малых значений: linear counting
+            return round(size * math.log(size / zeros))
+        return round(estimate)
+
+
+_INVERSE_POWERS = tuple(2.0 ** -rank for rank in range(66))
+
+
+class RollingWindow:
+    """Скользящее окно из кольца корзин: счетчики и HyperLogLog по шагам воронки
+
+    Итоговые счетчики окна поддерживаются инкрементально (прибавление в текущую корзину,
+    вычитание при вытеснении старой). Объединенные скетчи завершенных корзин собираются
+    лениво в summary() и кэшируются до смены корзины, поэтому add() не зависит от размера окна.
+    """
+
+    def __init__(self, bucket_seconds, size, steps, precision=10):
+        self.bucket_seconds = bucket_seconds
+        self.size = size
+        self.steps = steps
+        self.precision = precision
+        self.current = None
+        # Корзина: [номер интервала, {шаг: счетчик}, {шаг: HyperLogLog}]
+        self.buckets = [None] * size
+        self.totals = dict.fromkeys(steps, 0)
+        self._merged = {}
+        # Номер корзины, для которой собран _merged
+        self._merged_for = None
+
+    def _new_bucket(self, index):
+        return [index, dict.fromkeys(self.steps, 0), {step: HyperLogLog(self.precision) for step in self.steps}]
+
+    def _advance(self, now):
+        index = int(now // self.bucket_seconds)
+        if self.current is not None and index <= self.current:
+            # Та же корзина (или часы сдвинулись назад)
+            return self.buckets[self.current % self.size]
+        for slot, bucket in enumerate(self.buckets):
+            if bucket is not None and bucket[0] <= index - self.size:
+                for step, count in bucket[1].items():
+                    self.totals[step] -= count
+                self.buckets[slot] = None
+        bucket = self.buckets[index % self.size]
+        if bucket is None:
+            bucket = self.buckets[index % self.size] = self._new_bucket(index)
+        self.current = index
+        return bucket
+
+    def _completed_sketches(self):
+        """Объединенные скетчи всех корзин окна, кроме текущей; пересборка - раз на корзину"""
+        if self._merged_for == self.current:
+            return self._merged
+        completed = [bucket[2] for bucket in self.buckets if bucket is not None and bucket[0] != self.current]
+        merged = {}
+        if completed:
+            for step in self.steps:
+                registers = [sketches[step].registers for sketches in completed]
+                # Максимум по регистрам всех корзин за один проход (max() одного числа не принимает)
+                merged[step] = HyperLogLog(
+                    self.precision, bytes(map(max, *registers)) if len(registers) > 1 else registers[0]
+                )
+        self._merged = merged
+        self._merged_for = self.current
+        return merged
+
+    def add(self, step, hashed, now):
+        """Событие шага; hashed - 64-битный хэш id пользователя (см. _mix64)"""
+        bucket = self._advance(now)
+        bucket[1][step] += 1
+        bucket[2][step].add_hash(hashed)
+        self.totals[step] += 1
+
+    def summary(self, now):
+        """{шаг: (событий, уникальных пользователей)} за окно"""
+        bucket = self._advance(now)
+        completed = self._completed_sketches()
+        result = {}
+        for step in self.steps:
+            sketch = bucket[2][step]
+            if step in completed:
+                sketch = completed[step].merge(sketch)
+            result[step] = (self.totals[step], sketch.count())
+        return result
+
+    def dump(self):
+        """Снимок: метаданные в JSON и все регистры одним блоком байт"""
+        meta, blob = [], bytearray()
+        for bucket in self.buckets:
+            if bucket is None:
+                continue
+            meta.append([bucket[0], [bucket[1][step] for step in self.steps]])
+            for step in self.steps:
+                blob += bucket[2][step].registers
+        header = {"steps": list(self.steps), "precision": self.precision, "size": self.size,
+                  "bucket_seconds": self.bucket_seconds, "buckets": meta}
+        return json.dumps(header), bytes(blob)
+
+    def load(self, header, blob, now):
+        header = json.loads(header)
+        if (header["steps"] != list(self.steps) or header["precision"] != self.precision
+                or header["size"] != self.size or header["bucket_seconds"] != self.bucket_seconds):
+            logger.warning("⚠️ Снимок аналитики в другом формате, начинаем с нуля")
+            return
+        register_size = 1 << self.precision
+        offset = 0
+        self.buckets = [None] * self.size
+        self.totals = dict.fromkeys(self.steps, 0)
+        for index, counts in header["buckets"]:
+            bucket = [index, dict(zip(self.steps, counts)), {}]
+            for step in self.steps:
+                bucket[2][step] = HyperLogLog(self.precision, blob[offset:offset + register_size])
+                offset += register_size
+            self.buckets[index % self.size] = bucket
+            for step, count in bucket[1].items():
+                self.totals[step] += count
+        self.current = None
+        self._merged_for = None
+        self._advance(now)
+
+
+class FunnelAnalytics:
+    """Воронка в памяти процесса: скользящие окна 1ч / 24ч / 7д, счетчики и уникальные пользователи по шагам
+
+    track() - O(1) на событие: объединение скетчей окна выполняется только в summary() (админский /stats).
+    Снимки периодически пишутся в SQLite и загружаются при запуске.
+    В многопроцессном режиме у каждого воркера своя воронка и свой снимок (key).
+    """
+
+    def __init__(self, db_path=None, key="main", snapshot_interval=300.0, precision=10):
+        self.db_path = db_path
+        self.key = key
+        self.snapshot_interval = snapshot_interval
+        self.steps = tuple(step for step, _ in FUNNEL_STEPS)
+        self.windows = {
+            name: RollingWindow(bucket_seconds, size, self.steps, precision)
+            for name, (bucket_seconds, size) in WINDOWS.items()
+        }
+        self.events = 0
+        self.snapshots = 0
+        self._dirty = False
+        self._conn = None
+        self._lock = threading.Lock()
+        self._task = None
+
+    def track(self, step, user_id):
+        now = time.time()
+        hashed = _mix64(user_id)
+        for window in self.windows.values():
+            window.add(step, hashed, now)
+        self.events += 1
+        self._dirty = True
+
+    def summary(self, window):
+        return self.windows[window].summary(time.time())
+
+    async def start(self):
+        """Загрузка снимка и запуск периодического сохранения (если задан db_path)"""
+        if not self.db_path:
+            return
+        loaded = await asyncio.to_thread(self._open_and_load)
+        self._task = asyncio.create_task(self._snapshotter())
+        logger.info(f"📈 Аналитика воронки: снимок {'загружен' if loaded else 'не найден'} ({self.db_path})")
+
+    def _open_and_load(self):
+        self._conn = open_db(self.db_path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS funnel_snapshots ("
+            " key TEXT NOT NULL, window TEXT NOT NULL, header TEXT NOT NULL, registers BLOB NOT NULL,"
+            " saved_at REAL NOT NULL, PRIMARY KEY (key, window))"
+        )
+        rows = self._conn.execute(
+            "SELECT window, header, registers FROM funnel_snapshots WHERE key = ?", (self.key,)
+        ).fetchall()
+        now = time.time()
+        for name, header, registers in rows:
+            if name in self.windows:
+                self.windows[name].load(header, registers, now)
+        return bool(rows)
+
+    def _write(self, snapshot):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO funnel_snapshots (key, window, header, registers, saved_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(self.key, name, header, registers, now) for name, (header, registers) in snapshot.items()]
+            )
+            self._conn.execute("COMMIT")
+
+    async def save(self):
+        """Снимок собирается в event loop (без гонок с track), запись - в потоке"""
+        if self._conn is None or not self._dirty:
+            return
+        snapshot = {name: window.dump() for name, window in self.windows.items()}
+        self._dirty = False
+        await asyncio.to_thread(self._write, snapshot)
+        self.snapshots += 1
+
+    async def _snapshotter(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                await self.save()
+            except Exception as e:
+                logger.error(f"❌ Ошибка сохранения снимка аналитики: {e}")
+
+    async def stop(self):
+        """Финальный снимок и закрытие базы"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            await self.save()
+            with self._lock:
+                self._conn.close()
+            self._conn = None
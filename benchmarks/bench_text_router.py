@@ -0,0 +1,122 @@
+"""Микро-бенчмарк маршрутизации текста: цепочка фильтров aiogram против TextRouter
+
+Запуск: python benchmarks/bench_text_router.py [--updates 20000]
+Обработчики пустые, сеть не используется - измеряется только стоимость выбора обработчика.
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot, Dispatcher, types, F
+from aiogram.filters import Command
+from text_router import TextRouter
+
+# Примерное распределение входящих сообщений: кнопки меню, команды, вопросы о цене, свободный текст
+MESSAGE_MIX = [
+    ("📊 Услуги", 15), ("🖥 Портфолио", 8), ("📞 Контакты", 7), ("🛒 Заказать", 12),
+    ("/start", 10), ("/help", 3), ("/status", 2), ("/ping", 1), ("/unknown", 2),
+    ("Сколько стоит бот для магазина?", 8), ("Какая цена парсера?", 5), ("стоимость автоматизации excel", 4),
+    ("Здравствуйте! Хочу обсудить проект", 12), ("ок, спасибо", 6), ("Можно созвониться завтра утром?", 5),
+]
+
+
+async def noop(message, **kwargs):
+    return None
+
+
+def build_filter_chain():
+    """Цепочка фильтров в том виде, в каком она была до TextRouter"""
+    dp = Dispatcher()
+    dp.message(Command("start"))(noop)
+    dp.message(Command("help"))(noop)
+    dp.message(Command("status"))(noop)
+    dp.message(Command("ping"))(noop)
+    dp.message(F.text == "📊 Услуги")(noop)
+    dp.message(F.text == "🖥 Портфолио")(noop)
+    dp.message(F.text == "📞 Контакты")(noop)
+    dp.message(F.text == "🛒 Заказать")(noop)
+    dp.message(F.text.lower().contains("цена") | F.text.lower().contains("стоимость") | F.text.lower().contains("сколько"))(noop)
+    dp.message(F.text.startswith("/"))(noop)
+    dp.message()(noop)
+    return dp
+
+
+def build_text_router():
+    dp = Dispatcher()
+    router = TextRouter()
+    router.command("start", "help", "status", "ping")(noop)
+    router.exact("📊 Услуги", "🖥 Портфолио", "📞 Контакты", "🛒 Заказать")(noop)
+    router.keyword("цена", "стоимость", "сколько")(noop)
+    router.unknown_command(noop)
+    router.fallback(noop)
+    dp.message(F.text)(router.dispatch)
+    dp.message()(noop)
+    return dp, router
+
+
+def make_updates(count, seed=42):
+    rng = random.Random(seed)
+    texts, weights = zip(*MESSAGE_MIX)
+    return [
+        types.Update(
+            update_id=index,
+            message={
+                "message_id": index,
+                "date": 0,
+                "chat": {"id": 1000 + index % 50, "type": "private"},
+                "from": {"id": 1000 + index % 50, "is_bot": False, "first_name": "Test"},
+                "text": text,
+            },
+        )
+        for index, text in enumerate(rng.choices(texts, weights=weights, k=count))
+    ]
+
+
+async def measure(dp, bot, updates):
+    started = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return time.perf_counter() - started
+
+
+def measure_resolve(router, texts, rounds=5):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            router.resolve(text)
+    return (time.perf_counter() - started) / rounds
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=20000)
+    args = parser.parse_args()
+
+    bot = Bot(token="42:BENCHMARK")
+    updates = make_updates(args.updates)
+    chain_dp = build_filter_chain()
+    router_dp, router = build_text_router()
+
+    # Прогрев
+    await measure(chain_dp, bot, updates[:500])
+    await measure(router_dp, bot, updates[:500])
+
+    chain_time = await measure(chain_dp, bot, updates)
+    router_time = await measure(router_dp, bot, updates)
+    resolve_time = measure_resolve(router, [update.message.text for update in updates])
+    await bot.session.close()
+
+    print(f"Сообщений: {len(updates)}")
+    print(f"Цепочка фильтров aiogram: {chain_time / len(updates) * 1e6:8.1f} мкс/апдейт")
+    print(f"TextRouter (через dp):    {router_time / len(updates) * 1e6:8.1f} мкс/апдейт")
+    print(f"TextRouter.resolve:       {resolve_time / len(updates) * 1e6:8.2f} мкс/сообщение")
+    print(f"Ускорение диспетчеризации: x{chain_time / router_time:.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
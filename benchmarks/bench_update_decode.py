@@ -0,0 +1,105 @@
+"""Микро-бенчмарк разбора тела webhook: прежний путь против UpdateDecoder
+
+Запуск: python benchmarks/bench_update_decode.py [--updates 20000] [--unsupported 10]
+Прежний путь: json.loads -> types.Update(**data) -> повторная сборка в Dispatcher.feed_update
+(апдейт создан без контекста бота). Новый путь: UpdateDecoder.decode(body).
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiogram import Bot
+from aiogram.types import Update
+from bench_webhook import make_update, BOT_USER
+from update_decoder import UpdateDecoder, orjson
+
+ALLOWED_UPDATES = ["message", "callback_query"]
+
+
+def make_unsupported(update_id, rng):
+    """Апдейты, для которых у бота нет обработчиков"""
+    user_id = 100000 + rng.randrange(5000)
+    user = {"id": user_id, "is_bot": False, "first_name": "User"}
+    chat = {"id": user_id, "type": "private"}
+    if rng.random() < 0.5:
+        return {
+            "update_id": update_id,
+            "edited_message": {
+                "message_id": update_id, "date": int(time.time()), "edit_date": int(time.time()),
+                "chat": chat, "from": user, "text": "исправленный текст",
+            },
+        }
+    member = {"status": "member", "user": BOT_USER}
+    return {
+        "update_id": update_id,
+        "my_chat_member": {
+            "chat": chat, "from": user, "date": int(time.time()),
+            "old_chat_member": {"status": "kicked", "user": BOT_USER, "until_date": 0},
+            "new_chat_member": member,
+        },
+    }
+
+
+def old_decode(body, bot):
+    update = Update(**json.loads(body))
+    if update.bot != bot:
+        # То же, что делает Dispatcher.feed_update для апдейта без контекста бота
+        update = Update.model_validate(update.model_dump(), context={"bot": bot})
+    return update
+
+
+def measure(func, bodies, rounds):
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for body in bodies:
+            func(body)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(bodies) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--unsupported", type=float, default=10.0, help="доля неподдерживаемых апдейтов, %%")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    bot = Bot(token="42:BENCHMARK")
+    decoder = UpdateDecoder(bot, ALLOWED_UPDATES)
+
+    updates = []
+    for update_id in range(1, args.updates + 1):
+        if rng.random() * 100 < args.unsupported:
+            updates.append(make_unsupported(update_id, rng))
+        else:
+            updates.append(make_update(update_id, rng.choice(["menu", "text", "command", "order"]), rng))
+    bodies = [json.dumps(update, ensure_ascii=False).encode() for update in updates]
+
+    # Оба пути должны давать одинаковые апдейты для поддерживаемых типов
+    for body in bodies[:200]:
+        new = decoder.decode(body)
+        if new is not None:
+            assert new.model_dump() == old_decode(body, bot).model_dump()
+
+    old_us = measure(lambda body: old_decode(body, bot), bodies, args.rounds)
+    new_us = measure(decoder.decode, bodies, args.rounds)
+
+    print(f"Апдейтов: {args.updates}, неподдерживаемых: {args.unsupported:.0f}%, orjson: {'да' if orjson else 'нет'}")
+    print(f"Прежний путь (json + Update(**) + пересборка): {old_us:7.1f} мкс/апдейт")
+    print(f"UpdateDecoder:                                 {new_us:7.1f} мкс/апдейт")
+    print(f"Ускорение: {old_us / new_us:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
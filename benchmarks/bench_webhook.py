@@ -0,0 +1,309 @@
+"""Нагрузочный бенчмарк webhook: локальный aiohttp-сервер бота + заглушки Bot API и Apps Script
+
+Запуск: python benchmarks/bench_webhook.py --updates 5000 --concurrency 50
+Работает полностью офлайн: Telegram и Google Sheets подменяются локальными серверами,
+бот настраивается через TELEGRAM_API_URL и GSHEETS_URL.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import tracemalloc
+from aiohttp import web, ClientSession, TCPConnector
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BENCH_TOKEN = "42:BENCHMARK"
+BOT_USER = {"id": 42, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+MENU_TEXTS = ["📊 Услуги", "🖥 Портфолио", "📞 Контакты", "🛒 Заказать"]
+FREE_TEXTS = ["Здравствуйте! Хочу обсудить проект", "Сколько стоит бот?", "ок, спасибо", "Какая цена парсера?"]
+COMMANDS = ["/start", "/help", "/status", "/ping", "/unknown"]
+ORDER_CALLBACKS = ["order_parse", "order_excel", "order_bot", "order_consultation", "cancel_order"]
+# Ответы на шаги анкеты заказа: задача, срок, бюджет, контакт
+FORM_ANSWERS = ["Нужен бот для записи клиентов", "к концу месяца", "до 10 000 ₽", "@client"]
+
+
+class StubTelegram:
+    """Заглушка Bot API: отвечает на любой метод правдоподобным результатом"""
+
+    def __init__(self):
+        self.calls = 0
+        self.message_id = 0
+
+    async def handle(self, request):
+        self.calls += 1
+        method = request.match_info["method"].lower()
+        params = dict(await request.post())
+        if method == "getme":
+            result = BOT_USER
+        elif method == "getwebhookinfo":
+            result = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        elif method in ("sendmessage", "editmessagetext"):
+            self.message_id += 1
+            chat_id = int(params.get("chat_id", 0))
+            result = {
+                "message_id": int(params.get("message_id", self.message_id)),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+class StubSheets:
+    """Заглушка Google Apps Script"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.orders = 0
+
+    async def handle(self, request):
+        payload = await request.json()
+        await asyncio.sleep(self.delay)
+        self.orders += len(payload["orders"]) if "orders" in payload else 1
+        return web.json_response({"status": "success"})
+
+
+def make_user(rng):
+    user_id = 100000 + rng.randrange(5000)
+    return {"id": user_id, "is_bot": False, "first_name": "User", "username": f"user{user_id}"}
+
+
+def make_callback(update_id, user, data):
+    chat = {"id": user["id"], "type": "private"}
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": f"cb{update_id}",
+            "from": user,
+            "chat_instance": str(user["id"]),
+            "data": data,
+            "message": {
+                "message_id": update_id, "date": int(time.time()), "chat": chat,
+                "from": BOT_USER, "text": "🔍 Выберите услугу для заказа:",
+            },
+        },
+    }
+
+
+def make_message(update_id, user, text):
+    chat = {"id": user["id"], "type": "private"}
+    return {
+        "update_id": update_id,
+        "message": {"message_id": update_id, "date": int(time.time()), "chat": chat, "from": user, "text": text},
+    }
+
+
+def make_update(update_id, kind, rng):
+    user = make_user(rng)
+    if kind == "order":
+        return make_callback(update_id, user, rng.choice(ORDER_CALLBACKS))
+    text = {
+        "menu": lambda: rng.choice(MENU_TEXTS),
+        "text": lambda: rng.choice(FREE_TEXTS),
+        "command": lambda: rng.choice(COMMANDS),
+    }[kind]()
+    return make_message(update_id, user, text)
+
+
+def make_order_session(first_update_id, rng):
+    """Полный заказ одного пользователя: выбор услуги и ответы на все шаги анкеты"""
+    user = make_user(rng)
+    service = rng.choice([data for data in ORDER_CALLBACKS if data != "cancel_order"])
+    updates = [make_callback(first_update_id, user, service)]
+    for offset, answer in enumerate(FORM_ANSWERS, start=1):
+        updates.append(make_message(first_update_id + offset, user, answer))
+    return updates
+
+
+def make_sessions(count, mix, rng, first_update_id=1):
+    """Не меньше count апдейтов группами: заказ - сессия из нескольких апдейтов, остальное - по одному"""
+    kinds, weights = zip(*mix.items())
+    sessions, total, update_id = [], 0, first_update_id
+    while total < count:
+        kind = rng.choices(kinds, weights=weights)[0]
+        session = make_order_session(update_id, rng) if kind == "order" else [make_update(update_id, kind, rng)]
+        sessions.append(session)
+        update_id += len(session)
+        total += len(session)
+    return sessions, update_id
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+async def start_site(app, port=0):
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    return runner, runner.addresses[0][1]
+
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    stub_telegram = StubTelegram()
+    stub_sheets = StubSheets(args.sheets_delay)
+
+    stub_app = web.Application()
+    stub_app.router.add_post("/bot{token}/{method}", stub_telegram.handle)
+    stub_app.router.add_post("/exec", stub_sheets.handle)
+    stub_runner, stub_port = await start_site(stub_app)
+
+    data_dir = tempfile.mkdtemp(prefix="bench_webhook_")
+    os.environ.update({
+        "BOT_TOKEN": BENCH_TOKEN,
+        "GSHEETS_URL": f"http://127.0.0.1:{stub_port}/exec",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{stub_port}",
+        "DATA_DIR": data_dir,
+        "WEBHOOK_WORKERS": str(args.workers),
+        "WEBHOOK_QUEUE_SIZE": str(args.queue_size),
+    })
+    os.environ.pop("WEBHOOK_URL", None)
+    if not args.real_limits:
+        os.environ.setdefault("TG_GLOBAL_RATE", "1000000")
+        os.environ.setdefault("TG_CHAT_RATE", "1000000")
+        os.environ.setdefault("TG_CHAT_BURST", "1000000")
+        os.environ.setdefault("THROTTLE_RATE", "1000000")
+        os.environ.setdefault("THROTTLE_BURST", "1000000")
+
+    import bot as bot_module
+    logging.getLogger().setLevel(args.log_level)
+
+    # Заказы - сессии из нескольких апдейтов одного пользователя, отправляются по порядку
+    mix = parse_mix(args.mix)
+    warmup, next_update_id = make_sessions(args.warmup, mix, rng)
+    sessions, _ = make_sessions(args.updates, mix, rng, next_update_id)
+    expected = sum(len(session) for session in sessions)
+
+    # Время от отправки апдейта до окончания его обработки воркером
+    sent_at = {}
+    done_latency = []
+    all_done = asyncio.Event()
+    original_handler = bot_module.update_pool.handler
+
+    async def timed_handler(update):
+        try:
+            await original_handler(update)
+        finally:
+            started = sent_at.pop(update.update_id, None)
+            if started is not None:
+                done_latency.append(time.perf_counter() - started)
+            if len(done_latency) >= expected:
+                all_done.set()
+
+    bot_module.update_pool.handler = timed_handler
+
+    # Тот же запуск, что в main(): хранилища, фоновые задачи и пул обработки апдейтов
+    await bot_module.start_components(webhook=True)
+    app_runner, app_port = await start_site(bot_module.create_app())
+
+    url = f"http://127.0.0.1:{app_port}/webhook"
+    ack_latency = []
+    statuses = {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with ClientSession(connector=TCPConnector(limit=args.concurrency)) as session:
+        async def send(updates, record):
+            async with semaphore:
+                for update in updates:
+                    body = json.dumps(update).encode()
+                    started = time.perf_counter()
+                    if record:
+                        sent_at[update["update_id"]] = started
+                    async with session.post(url, data=body, headers={"Content-Type": "application/json"}) as response:
+                        await response.read()
+                        statuses[response.status] = statuses.get(response.status, 0) + 1
+                    if record:
+                        ack_latency.append(time.perf_counter() - started)
+
+        # Прогрев: импорт, первые соединения, JIT-кэши pydantic
+        await asyncio.gather(*(send(updates, False) for updates in warmup))
+        await asyncio.sleep(0.5)
+        done_latency.clear()
+        statuses.clear()
+
+        if args.tracemalloc:
+            tracemalloc.start()
+        rss_before = rss_mb()
+        started = time.perf_counter()
+        await asyncio.gather(*(send(updates, True) for updates in sessions))
+        acked = time.perf_counter() - started
+        try:
+            await asyncio.wait_for(all_done.wait(), timeout=args.timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Не все апдейты обработаны за {args.timeout}с")
+        elapsed = time.perf_counter() - started
+        traced = tracemalloc.get_traced_memory() if args.tracemalloc else None
+
+    # Оформленные заказы уходят в Sheets фоновой очередью: дожидаемся отправки
+    pending_orders = await bot_module.order_queue.drain(args.timeout)
+
+    processed = len(done_latency)
+    print(f"Апдейтов: {expected}, конкурентность: {args.concurrency}, воркеров: {args.workers}")
+    print(f"Статусы webhook: {statuses}")
+    print(f"Прием (ack):      {expected / acked:8.0f} апд/с за {acked:.2f}с")
+    print(f"Обработка:        {processed / elapsed:8.0f} апд/с за {elapsed:.2f}с")
+    for title, values in (("Ответ webhook", ack_latency), ("До конца обработки", done_latency)):
+        print(
+            f"{title:<20} p50={percentile(values, 50) * 1000:7.2f}мс "
+            f"p95={percentile(values, 95) * 1000:7.2f}мс p99={percentile(values, 99) * 1000:7.2f}мс"
+        )
+    print(f"Память (max RSS): {rss_before:.1f} -> {rss_mb():.1f} МБ")
+    if traced:
+        print(f"tracemalloc: текущая {traced[0] / 1e6:.1f} МБ, пик {traced[1] / 1e6:.1f} МБ")
+    print(f"Вызовов Bot API: {stub_telegram.calls}, заказов в Sheets: {stub_sheets.orders}, "
+          f"не отправлено: {pending_orders}")
+
+    await app_runner.cleanup()
+    await bot_module.stop_components(webhook=True)
+    await stub_runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--mix", default="menu=40,order=15,text=30,command=15",
+                        help="доли типов апдейтов: menu, order (выбор услуги и ответы анкеты), text, command")
+    parser.add_argument("--sheets-delay", type=float, default=0.05, help="задержка заглушки Apps Script, с")
+    parser.add_argument("--real-limits", action="store_true", help="не ослаблять лимиты отправки Telegram")
+    parser.add_argument("--tracemalloc", action="store_true")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,151 @@
+import time
+# Отсчет времени холодного старта - до импорта тяжелых зависимостей
+BOOT_STARTED = time.perf_counter()
+
 import os
+import sys
+import signal
 import asyncio
 import logging
+import multiprocessing
+from multiprocessing.connection import wait as wait_processes
 import aiohttp
 from datetime import datetime
 from aiohttp import web
 from aiohttp.web import Request
-from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command
+from aiogram import Bot, Dispatcher, types, F, html
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.types import (
     ReplyKeyboardMarkup,
     KeyboardButton,
     InlineKeyboardMarkup,
     InlineKeyboardButton
 )
+from http_client import HttpClient
+from order_queue import OrderQueue
+from order_store import OrderStore
+from update_queue import UpdateWorkerPool
+from update_decoder import UpdateDecoder
+from dedup import UpdateDeduplicator
+from order_forms import OrderForm, OrderFormStore
+from user_registry import UserRegistry
+from broadcast import Broadcaster
+from analytics import FunnelAnalytics, FUNNEL_STEPS, WINDOWS
+from catalog import CatalogLoader, ORDER_CALLBACK_PREFIX, CANCEL_CALLBACK
+from text_router import TextRouter
+from send_scheduler import SendScheduler
+from throttling import ThrottlingMiddleware
+from shared_state import SharedState
+from runtime_info import RuntimeInfo, StartupTimings
+from log_pipeline import setup_logging, parse_category_map, parse_rate_limits
+from metrics import BotMetrics, UpdateMetricsMiddleware, HandlerMetricsMiddleware, ApiMetricsMiddleware
+
+startup_timings = StartupTimings(BOOT_STARTED)
+startup_timings.mark("import")
 
 TOKEN = os.getenv('BOT_TOKEN')
 GSHEETS_URL = os.getenv('GSHEETS_URL')
 WEBHOOK_URL = os.getenv('WEBHOOK_URL')
 PORT = int(os.getenv('PORT', 8000))
+# Свой адрес Bot API (локальный telegram-bot-api или заглушка в бенчмарках)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+HTTP_POOL_LIMIT = int(os.getenv('HTTP_POOL_LIMIT', 100))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', 10))
+HTTP_DNS_TTL = int(os.getenv('HTTP_DNS_TTL', 300))
+HTTP_KEEPALIVE_TIMEOUT = int(os.getenv('HTTP_KEEPALIVE_TIMEOUT', 30))
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+ORDER_QUEUE_DB = os.getenv('ORDER_QUEUE_DB', os.path.join(DATA_DIR, 'orders_queue.db'))
+ORDER_BATCH_SIZE = int(os.getenv('ORDER_BATCH_SIZE', 20))
+ORDERS_PAGE_SIZE = int(os.getenv('ORDERS_PAGE_SIZE', 5))
+# Telegram ID администраторов через запятую (команда /orders)
+ADMIN_IDS = {int(value) for value in os.getenv('ADMIN_IDS', '').split(',') if value.strip()}
+# Включать только если Apps Script умеет принимать {"orders": [...]} одним запросом
+GSHEETS_BATCH = os.getenv('GSHEETS_BATCH', '0') == '1'
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 8))
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000))
+WEBHOOK_ENQUEUE_TIMEOUT = float(os.getenv('WEBHOOK_ENQUEUE_TIMEOUT', 0.5))
+# Число процессов-воркеров webhook на одном порту (SO_REUSEPORT); по умолчанию 1 - обычный однопроцессный режим.
+# Не WEB_CONCURRENCY: ее выставляет сам Heroku по размеру dyno, а многопроцессный режим включается только явно
+# Общие для воркеров: дедупликация, анкеты, per-chat лимит отправки и лимит частоты пользователя (SharedState);
+# глобальный лимит отправки делится поровну. Свои у каждого воркера: защита от двойных нажатий, воронка /stats
+# и метрики - /metrics отвечает воркер, принявший соединение, серии помечены меткой worker
+WORKER_COUNT = max(1, int(os.getenv('WEBHOOK_PROCESSES', 1)))
+MULTI_WORKER = WORKER_COUNT > 1 and bool(WEBHOOK_URL)
+SHARED_STATE_DB = os.path.join(DATA_DIR, 'shared_state.db')
+# Воркер, упавший быстрее WORKER_MIN_UPTIME секунд после запуска, перезапускается с экспоненциальной
+# задержкой (до WORKER_BACKOFF_MAX); после WORKER_MAX_FAST_FAILURES таких падений подряд супервизор сдается
+WORKER_MIN_UPTIME = float(os.getenv('WORKER_MIN_UPTIME', 30))
+WORKER_BACKOFF_MAX = float(os.getenv('WORKER_BACKOFF_MAX', 60))
+WORKER_MAX_FAST_FAILURES = int(os.getenv('WORKER_MAX_FAST_FAILURES', 5))
+RUNTIME_INFO_TTL = float(os.getenv('RUNTIME_INFO_TTL', 60))
+# Сколько секунд после SIGTERM дообрабатываются апдейты и заказы (Heroku ждет 30с до SIGKILL)
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', 20))
+DEDUP_MAX_SIZE = int(os.getenv('DEDUP_MAX_SIZE', 10000))
+DEDUP_TTL = int(os.getenv('DEDUP_TTL', 86400))
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+# Категории: webhook, health, handler, order, sheets, keepalive
+LOG_DISABLE = os.getenv('LOG_DISABLE', '')
+LOG_SAMPLE = os.getenv('LOG_SAMPLE', '')
+LOG_RATE_LIMIT = os.getenv('LOG_RATE_LIMIT', 'health=1/60')
+TG_GLOBAL_RATE = float(os.getenv('TG_GLOBAL_RATE', 30))
+TG_CHAT_RATE = float(os.getenv('TG_CHAT_RATE', 1))
+TG_CHAT_BURST = int(os.getenv('TG_CHAT_BURST', 3))
+USERS_DB = os.path.join(DATA_DIR, 'users.db')
+ANALYTICS_DB = os.path.join(DATA_DIR, 'analytics.db')
+ANALYTICS_SNAPSHOT_INTERVAL = float(os.getenv('ANALYTICS_SNAPSHOT_INTERVAL', 300))
+# Сообщений рассылки в секунду (не больше глобального лимита отправки)
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', 20))
+# Входящие от одного пользователя: в среднем THROTTLE_RATE в секунду, подряд до THROTTLE_BURST
+THROTTLE_RATE = float(os.getenv('THROTTLE_RATE', 1))
+THROTTLE_BURST = int(os.getenv('THROTTLE_BURST', 5))
+CATALOG_PATH = os.getenv('CATALOG_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog.json'))
+CATALOG_CHECK_INTERVAL = float(os.getenv('CATALOG_CHECK_INTERVAL', 5))
+# В многопроцессном режиме дедупликация всегда идет через общую базу
+DEDUP_DB = os.path.join(DATA_DIR, 'dedup.db') if MULTI_WORKER or os.getenv('DEDUP_PERSIST', '0') == '1' else None
+# Анкеты заказов: брошенные удаляются через ORDER_FORM_TTL секунд, в памяти не больше ORDER_FORM_MAX
+ORDER_FORM_TTL = int(os.getenv('ORDER_FORM_TTL', 86400))
+ORDER_FORM_MAX = int(os.getenv('ORDER_FORM_MAX', 10000))
+ORDER_FORM_DB = os.path.join(DATA_DIR, 'order_forms.db') if MULTI_WORKER or os.getenv('ORDER_FORM_PERSIST', '1') == '1' else None
 
 if not TOKEN:
     raise ValueError('BOT_TOKEN не установлен в переменных окружения')
 if not GSHEETS_URL:
     raise ValueError('GSHEETS_URL не установлен в переменных окружения')
 
-bot = Bot(token=TOKEN)
+if TELEGRAM_API_URL:
+    bot = Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)))
+else:
+    bot = Bot(token=TOKEN)
 dp = Dispatcher()
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# Все запросы к Bot API проходят через планировщик с учетом лимитов Telegram
+send_scheduler = SendScheduler(
+    # Глобальный лимит Telegram делится поровну между процессами-воркерами
+    global_rate=TG_GLOBAL_RATE / (WORKER_COUNT if MULTI_WORKER else 1),
+    chat_rate=TG_CHAT_RATE,
+    chat_burst=TG_CHAT_BURST
+)
+bot.session.middleware(send_scheduler)
+
+# Метрики Prometheus (/metrics); API-метрики стоят после планировщика и не учитывают ожидание лимитов
+metrics = BotMetrics()
+bot.session.middleware(ApiMetricsMiddleware(metrics))
+dp.update.outer_middleware(UpdateMetricsMiddleware(metrics))
+
+# Лимит частоты на пользователя и защита от двойных нажатий - до фильтров и обработчиков
+throttling = ThrottlingMiddleware(rate=THROTTLE_RATE, burst=THROTTLE_BURST)
+dp.message.outer_middleware(throttling)
+dp.callback_query.outer_middleware(throttling)
+
+# Логи пишутся из фонового потока; категории горячего пути можно отключать/сэмплировать через окружение
+log_filter = setup_logging(
+    level=LOG_LEVEL,
+    fmt=LOG_FORMAT,
+    disabled=[name.strip() for name in LOG_DISABLE.split(',') if name.strip()],
+    sample=parse_category_map(LOG_SAMPLE),
+    rate_limits=parse_rate_limits(LOG_RATE_LIMIT)
 )
 logger = logging.getLogger(__name__)
 
@@ -39,6 +155,30 @@ class KeepAliveSystem:
         self.ping_count = 0
         self.is_running = True
         self.start_time = datetime.now()
+        self.shared_state = None
+        self._sync_task = None
+
+    async def attach_shared_state(self, shared_state, sync_interval=60.0):
+        """Многопроцессный режим: время запуска и счетчик пингов общие для всех воркеров
+
+        Значения читаются из SharedState в потоке и кэшируются - /health и /status не обращаются к базе.
+        Пингует только воркер 0, остальные подтягивают счетчик раз в sync_interval секунд.
+        """
+        self.shared_state = shared_state
+        started, self.ping_count = await asyncio.to_thread(self._read_shared)
+        self.start_time = datetime.fromtimestamp(started)
+        self._sync_task = asyncio.create_task(self._sync_shared(sync_interval))
+
+    def _read_shared(self):
+        return self.shared_state.get('start_time', time.time()), int(self.shared_state.get('ping_count'))
+
+    async def _sync_shared(self, interval):
+        while self.is_running:
+            await asyncio.sleep(interval)
+            try:
+                _, self.ping_count = await asyncio.to_thread(self._read_shared)
+            except Exception as e:
+                logger.error(f"❌ Ошибка чтения общего счетчика пингов: {e}")
     
     async def start_keep_alive(self):
         """Запуск системы поддержания активности"""
@@ -53,17 +193,22 @@ class KeepAliveSystem:
     
     async def perform_ping(self):
         """Выполнение пинга для поддержания активности"""
-        self.ping_count += 1
+        if self.shared_state is not None:
+            self.ping_count = int(await asyncio.to_thread(self.shared_state.incr, 'ping_count'))
+        else:
+            self.ping_count += 1
+        ping_number = self.ping_count
         current_time = datetime.now()
         
         try:
             if WEBHOOK_URL:
                 url = f"{WEBHOOK_URL}/health"
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(url, timeout=30) as response:
-                        logger.info(f"🏓 Keep-alive ping #{self.ping_count}: {response.status} в {current_time.strftime('%H:%M:%S')}")
+                async with http_client.session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as response:
+                    logger.info("🏓 Keep-alive ping #%s: %s в %s", ping_number, response.status,
+                                current_time, extra={"category": "keepalive"})
             else:
-                logger.info(f"🏓 Keep-alive ping #{self.ping_count} в {current_time.strftime('%H:%M:%S')} (локальный режим)")
+                logger.info("🏓 Keep-alive ping #%s в %s (локальный режим)", ping_number, current_time,
+                            extra={"category": "keepalive"})
                 
         except Exception as e:
             logger.error(f"❌ Ping failed: {e}")
@@ -85,11 +230,95 @@ class KeepAliveSystem:
     def stop(self):
         """Остановка keep-alive системы"""
         self.is_running = False
+        if self._sync_task:
+            self._sync_task.cancel()
+            self._sync_task = None
         logger.info("🛑 Keep-alive система остановлена")
 
 # Глобальный экземпляр keep-alive
 keep_alive = KeepAliveSystem()
 
+# Сведения о боте и webhook, обновляемые в фоне (для /status, /health и метрик)
+runtime_info = RuntimeInfo(bot, ttl=RUNTIME_INFO_TTL)
+
+# Общий HTTP-клиент для Google Sheets и keep-alive (сессия создается в main())
+http_client = HttpClient(
+    limit=HTTP_POOL_LIMIT,
+    limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+    dns_ttl=HTTP_DNS_TTL,
+    keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT
+)
+
+async def post_to_sheets(payload):
+    """POST в Google Apps Script; исключение при любом статусе, кроме 200/302"""
+    started = time.perf_counter()
+    try:
+        async with http_client.session.post(
+                GSHEETS_URL,
+                json=payload,
+                headers={
+                    'Content-Type': 'application/json',
+                    'Accept': 'application/json'
+                },
+                timeout=aiohttp.ClientTimeout(total=15)
+        ) as response:
+            response_text = await response.text()
+            logger.info("Google Sheets ответ: %s", response.status, extra={"category": "sheets"})
+            logger.debug("Google Sheets тело ответа: %s", response_text, extra={"category": "sheets"})
+
+            if response.status not in [200, 302]:
+                logger.error(f"Неожиданный статус от Google Sheets: {response.status}")
+                raise aiohttp.ClientError(f"HTTP {response.status}")
+    except Exception:
+        metrics.sheets_errors.inc()
+        raise
+    finally:
+        metrics.sheets_latency.observe(time.perf_counter() - started)
+
+async def send_orders_batch(orders):
+    """Пакетная отправка заказов одним запросом"""
+    await post_to_sheets({"orders": orders})
+
+# Журнал заказов с фоновой отправкой в Google Sheets (запускается в main())
+order_queue = OrderQueue(
+    ORDER_QUEUE_DB,
+    send_order=post_to_sheets,
+    send_batch=send_orders_batch if GSHEETS_BATCH else None,
+    batch_size=ORDER_BATCH_SIZE
+)
+
+# Локальная база заказов для /myorders и /orders (тот же файл, что и журнал очереди)
+order_store = OrderStore(ORDER_QUEUE_DB, page_size=ORDERS_PAGE_SIZE)
+
+# Реестр пользователей и рассылки (отправляет только основной процесс)
+user_registry = UserRegistry(USERS_DB)
+broadcaster = Broadcaster(
+    user_registry,
+    bot,
+    USERS_DB,
+    rate=min(BROADCAST_RATE, send_scheduler.global_limiter.bucket.rate)
+)
+
+async def remember_user(user):
+    """Запись в реестр пользователей; ошибка не мешает ответу пользователю"""
+    try:
+        await user_registry.touch(user)
+    except Exception as e:
+        logger.error(f"❌ Ошибка записи пользователя {user.id} в реестр: {e}")
+
+# Воронка: от /start через меню до оформленного или отмененного заказа (см. /stats)
+analytics = FunnelAnalytics(ANALYTICS_DB, snapshot_interval=ANALYTICS_SNAPSHOT_INTERVAL)
+
+# Каталог услуг: тексты и клавиатуры собираются один раз при загрузке файла
+catalog = CatalogLoader(CATALOG_PATH, check_interval=CATALOG_CHECK_INTERVAL)
+catalog.load()
+
+# Анкеты заказов: шаги между нажатием на услугу и оформлением заказа
+order_forms = OrderFormStore(max_size=ORDER_FORM_MAX, ttl=ORDER_FORM_TTL, db_path=ORDER_FORM_DB, shared=MULTI_WORKER)
+
+# Все текстовые сообщения проходят через один маршрутизатор (см. text_router.py)
+text_router = TextRouter()
+
 main_menu = ReplyKeyboardMarkup(
     keyboard=[
         [KeyboardButton(text="📊 Услуги")],
@@ -101,24 +330,32 @@ main_menu = ReplyKeyboardMarkup(
     input_field_placeholder="Выберите действие..."
 )
 
+order_cancel_keyboard = InlineKeyboardMarkup(
+    inline_keyboard=[[InlineKeyboardButton(text="❌ Отменить заказ", callback_data=CANCEL_CALLBACK)]]
+)
+
 # Улучшенный обработчик команды start
-@dp.message(Command("start"))
+@text_router.command("start")
 async def start(message: types.Message):
-    logger.info(f"👤 Команда /start от пользователя {message.from_user.id} ({message.from_user.full_name})")
+    logger.info("👤 Команда /start от пользователя %s (%s)", message.from_user.id, message.from_user.full_name,
+                extra={"category": "handler"})
+    await remember_user(message.from_user)
+    analytics.track("start", message.from_user.id)
     await message.answer(
         "🚀 Добро пожаловать! Я помогу автоматизировать ваш бизнес.\n"
         "Выберите действие:",
         reply_markup=main_menu
     )
 
-@dp.message(Command("help"))
+@text_router.command("help")
 async def help_command(message: types.Message):
-    logger.info(f"❓ Команда /help от пользователя {message.from_user.id}")
+    logger.info("❓ Команда /help от пользователя %s", message.from_user.id, extra={"category": "handler"})
     await message.answer(
         "ℹ️ <b>Доступные команды:</b>\n\n"
         "/start - Запустить бота\n"
         "/help - Показать справку\n"
         "/status - Статус бота\n"
+        "/myorders - Мои заказы\n"
         "/ping - Проверка связи\n\n"
         "Используйте кнопки меню для навигации.",
         parse_mode="HTML",
@@ -126,19 +363,38 @@ async def help_command(message: types.Message):
     )
 
 # Улучшенный обработчик команды status с дополнительной информацией
-@dp.message(Command("status"))
+@text_router.command("status")
 async def status_command(message: types.Message):
-    logger.info(f"📊 Команда /status от пользователя {message.from_user.id} ({message.from_user.full_name})")
+    logger.info("📊 Команда /status от пользователя %s (%s)", message.from_user.id, message.from_user.full_name,
+                extra={"category": "handler"})
     
-    # Получаем информацию о webhook
-    try:
-        webhook_info = await bot.get_webhook_info()
+    # Информация о webhook берется из кэша, без запроса к Telegram
+    webhook_info = runtime_info.webhook_info
+    info_age = runtime_info.age_seconds
+    if webhook_info is not None:
         webhook_status = "🟢 Активен" if webhook_info.url else "🔴 Не установлен"
-        webhook_url_display = webhook_info.url if webhook_info.url else "Не установлен"
-    except Exception as e:
-        webhook_status = f"⚠️ Ошибка: {str(e)[:50]}"
-        webhook_url_display = "Недоступно"
+        if webhook_info.last_error_date:
+            webhook_status += f", последняя ошибка {webhook_info.last_error_date.strftime('%d.%m.%Y %H:%M')}"
+    elif runtime_info.last_refresh_error:
+        webhook_status = f"⚠️ Ошибка: {runtime_info.last_refresh_error[:50]}"
+    else:
+        webhook_status = "⏳ Нет данных"
+    info_age_text = f"{info_age:.0f}с назад" if info_age is not None else "еще не обновлялись"
     
+    pool_stats = http_client.get_stats()
+    queue_stats = await order_queue.get_stats()
+    update_stats = update_pool.get_stats()
+    dedup_stats = update_dedup.get_stats()
+    send_stats = send_scheduler.get_stats()
+    form_stats = order_forms.get_stats()
+    throttle_stats = throttling.get_stats()
+    broadcast_stats = broadcaster.get_stats()
+    broadcast_status = (
+        f"#{broadcast_stats['id']}: {broadcast_stats['sent']} отправлено, {broadcast_stats['failed']} ошибок, "
+        f"{broadcast_stats['blocked']} заблокировали"
+        if broadcast_stats['running'] else "нет активной"
+    )
+
     # Формируем сообщение со статусом
     status_message = (
         f"✅ <b>Статус бота:</b>\n\n"
@@ -147,19 +403,37 @@ async def status_command(message: types.Message):
         f"🌐 <b>Сервер:</b> {'Heroku' if WEBHOOK_URL else 'Local'}\n"
         f"🔄 <b>Режим:</b> {'Webhook' if WEBHOOK_URL else 'Polling'}\n"
         f"📡 <b>Webhook:</b> {webhook_status}\n"
+        f"📥 <b>Ожидают доставки:</b> {runtime_info.pending_update_count} апдейтов "
+        f"(данные {info_age_text})\n"
         f"📊 <b>Состояние:</b> Активен\n"
         f"⏱️ <b>Время работы:</b> {keep_alive.get_uptime()}\n"
         f"🏓 <b>Keep-alive пингов:</b> {keep_alive.ping_count}\n"
+        f"📨 <b>Очередь апдейтов:</b> {update_stats['depth']}/{update_stats['max_queue']}, "
+        f"обработка ~{update_stats['latency_avg_ms']:.0f}мс\n"
+        f"🔁 <b>Повторы апдейтов:</b> {dedup_stats['hits']} отсеяно, {dedup_stats['misses']} новых\n"
+        f"🚦 <b>Ограничение частоты:</b> {throttle_stats['throttled']} отброшено, "
+        f"{throttle_stats['duplicates']} двойных нажатий\n"
+        f"📤 <b>Отправка:</b> {send_stats['sent']} запросов, ожидание ~{send_stats['wait_avg_ms']:.0f}мс, "
+        f"RetryAfter: {send_stats['retry_after']}\n"
+        f"🔌 <b>HTTP-пул:</b> {pool_stats['requests']} запросов, "
+        f"{pool_stats['connections_created']} соединений, "
+        f"{pool_stats['connections_reused']} повторных\n"
+        f"📦 <b>Очередь заказов:</b> {queue_stats['depth']} в ожидании, "
+        f"задержка {queue_stats['lag_seconds']:.0f}с\n"
+        f"📣 <b>Рассылка:</b> {broadcast_status}\n"
+        f"📝 <b>Анкеты заказов:</b> {form_stats['active']} заполняются, "
+        f"{form_stats['completed']} оформлено, {form_stats['expired']} брошено\n"
         f"⏰ <b>Текущее время:</b> {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n"
-        f"🕐 <b>Время запуска:</b> {keep_alive.start_time.strftime('%d.%m.%Y %H:%M:%S')}"
+        f"🕐 <b>Время запуска:</b> {keep_alive.start_time.strftime('%d.%m.%Y %H:%M:%S')}\n"
+        f"🚀 <b>Холодный старт:</b> {startup_timings.total:.2f}с ({startup_timings.format()})"
     )
     
     await message.answer(status_message, parse_mode="HTML")
 
 # Новая команда для быстрой проверки связи
-@dp.message(Command("ping"))
+@text_router.command("ping")
 async def ping_command(message: types.Message):
-    logger.info(f"🏓 Команда /ping от пользователя {message.from_user.id}")
+    logger.info("🏓 Команда /ping от пользователя %s", message.from_user.id, extra={"category": "handler"})
     start_time = datetime.now()
     
     sent_message = await message.answer("🏓 Понг!")
@@ -175,28 +449,181 @@ async def ping_command(message: types.Message):
         parse_mode="HTML"
     )
 
-@dp.message(F.text == "📊 Услуги")
-async def show_services(message: types.Message):
+MY_ORDERS_CALLBACK = "myorders:"
+ADMIN_ORDERS_CALLBACK = "orders:"
+
+def format_orders(title, orders):
+    """Список заказов для /myorders и /orders"""
+    lines = [f"📋 <b>{title}</b>\n"]
+    for order in orders:
+        created = datetime.fromtimestamp(order.created_at).strftime('%d.%m.%Y %H:%M')
+        delivery = "📤 передан" if order.delivered else "⏳ ожидает отправки"
+        lines.append(f"<b>#{order.id}</b> · {created} · {html.quote(order.service)}")
+        lines.append(f"   Статус: {html.quote(order.status)}, {delivery}")
+        if order.task:
+            lines.append(f"   📝 {html.quote(order.task[:100])}")
+        lines.append("")
+    return "\n".join(lines)
+
+def next_page_keyboard(callback_data):
+    return InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="➡️ Еще", callback_data=callback_data)]]
+    )
+
+async def send_my_orders(message: types.Message, user_id, before_id=None):
+    orders, next_before = await order_store.by_client(user_id, before_id=before_id)
+    if not orders:
+        await message.answer("📭 У вас пока нет заказов. Оформить: «🛒 Заказать».", reply_markup=main_menu)
+        return
+    keyboard = next_page_keyboard(f"{MY_ORDERS_CALLBACK}{next_before}") if next_before else None
+    await message.answer(format_orders("Ваши заказы:", orders), parse_mode="HTML", reply_markup=keyboard)
+
+@text_router.command("myorders")
+async def my_orders_command(message: types.Message):
+    logger.info("📋 Команда /myorders от пользователя %s", message.from_user.id, extra={"category": "handler"})
+    await send_my_orders(message, message.from_user.id)
+
+@dp.callback_query(F.data.startswith(MY_ORDERS_CALLBACK))
+async def my_orders_page(callback: types.CallbackQuery):
+    await callback.answer()
+    await send_my_orders(callback.message, callback.from_user.id, int(callback.data[len(MY_ORDERS_CALLBACK):]))
+
+def parse_orders_filter(argument):
+    """Аргумент /orders: ID клиента, дата ДД.ММ.ГГГГ или статус"""
+    if not argument:
+        return "", ""
+    if argument.isdigit():
+        return "client", argument
+    try:
+        datetime.strptime(argument, '%d.%m.%Y')
+        return "day", argument
+    except ValueError:
+        return "status", argument
+
+async def send_admin_orders(message: types.Message, kind, value, before_id=None):
+    filters = {}
+    if kind == "client":
+        filters["client_id"] = int(value)
+    elif kind == "day":
+        filters["day"] = datetime.strptime(value, '%d.%m.%Y').timestamp()
+    elif kind == "status":
+        filters["status"] = value
+    orders, next_before = await order_store.search(before_id=before_id, **filters)
+    if not orders:
+        await message.answer("📭 Заказов не найдено")
+        return
+    title = f"Заказы ({html.quote(value)}):" if value else "Заказы:"
+    keyboard = None
+    callback_data = f"{ADMIN_ORDERS_CALLBACK}{kind}:{value}:{next_before}"
+    # callback_data ограничена 64 байтами; для очень длинного статуса кнопка не показывается
+    if next_before and len(callback_data.encode()) <= 64:
+        keyboard = next_page_keyboard(callback_data)
+    await message.answer(format_orders(title, orders), parse_mode="HTML", reply_markup=keyboard)
+
+@text_router.command("orders")
+async def admin_orders_command(message: types.Message):
+    """/orders [ID клиента | ДД.ММ.ГГГГ | статус] - заказы для администратора"""
+    if message.from_user.id not in ADMIN_IDS:
+        await debug_commands(message)
+        return
+    logger.info("📋 Команда /orders от администратора %s", message.from_user.id, extra={"category": "handler"})
+    parts = message.text.split(maxsplit=1)
+    kind, value = parse_orders_filter(parts[1].strip() if len(parts) > 1 else "")
+    await send_admin_orders(message, kind, value)
+
+@dp.callback_query(F.data.startswith(ADMIN_ORDERS_CALLBACK))
+async def admin_orders_page(callback: types.CallbackQuery):
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("⛔ Недоступно", show_alert=True)
+        return
+    await callback.answer()
+    kind, rest = callback.data[len(ADMIN_ORDERS_CALLBACK):].split(":", 1)
+    value, before_id = rest.rsplit(":", 1)
+    await send_admin_orders(callback.message, kind, value, int(before_id))
+
+@text_router.command("broadcast")
+async def broadcast_command(message: types.Message):
+    """/broadcast текст (или ответом на сообщение) - рассылка всем; /broadcast stop - отмена"""
+    if message.from_user.id not in ADMIN_IDS:
+        await debug_commands(message)
+        return
+    parts = message.html_text.split(maxsplit=1)
+    argument = parts[1] if len(parts) > 1 else ""
+
+    if argument.lower() == "stop":
+        cancelled = await broadcaster.cancel()
+        await message.answer(f"⛔ Отменено рассылок: {cancelled}")
+        return
+
+    if message.reply_to_message is not None and message.reply_to_message.text:
+        argument = message.reply_to_message.html_text
+    if not argument:
+        latest = await broadcaster.latest()
+        usage = (
+            "📣 <b>Рассылка:</b>\n"
+            "/broadcast текст - отправить всем пользователям\n"
+            "/broadcast ответом на сообщение - переслать его текст\n"
+            "/broadcast stop - остановить"
+        )
+        if latest is not None:
+            usage = f"{await broadcaster.format_progress(latest)}\n\n{usage}"
+        await message.answer(usage, parse_mode="HTML")
+        return
+
+    logger.info("📣 Команда /broadcast от администратора %s", message.from_user.id, extra={"category": "handler"})
+    progress = await message.answer("📣 Рассылка готовится...")
+    broadcast_id = await broadcaster.create(
+        argument,
+        parse_mode="HTML",
+        admin_chat_id=message.chat.id,
+        progress_message_id=progress.message_id
+    )
+    await progress.edit_text(
+        f"📣 <b>Рассылка #{broadcast_id} поставлена в очередь</b>\n"
+        f"Получателей: {await user_registry.count_active()}, скорость: {broadcaster.rate:.0f} сообщ./с",
+        parse_mode="HTML"
+    )
+
+WINDOW_TITLES = {"1h": "1 час", "24h": "24 часа", "7d": "7 дней"}
+
+def format_funnel(window):
+    """Блок /stats для одного окна: события / пользователи и конверсия от /start"""
+    summary = analytics.summary(window)
+    started_users = summary["start"][1]
+    lines = [f"📈 <b>Воронка за {WINDOW_TITLES[window]}</b>"]
+    for step, title in FUNNEL_STEPS:
+        events, users = summary[step]
+        line = f"{title}: {events} / {users}"
+        if step != "start" and started_users:
+            line += f" · {users / started_users:.0%}"
+        lines.append(line)
+    return "\n".join(lines)
+
+@text_router.command("stats")
+async def stats_command(message: types.Message):
+    """/stats [1h|24h|7d] - воронка для администратора (из памяти, без запросов к базе)"""
+    if message.from_user.id not in ADMIN_IDS:
+        await debug_commands(message)
+        return
+    logger.info("📈 Команда /stats от администратора %s", message.from_user.id, extra={"category": "handler"})
+    parts = message.text.split(maxsplit=1)
+    windows = [parts[1].strip().lower()] if len(parts) > 1 and parts[1].strip().lower() in WINDOWS else list(WINDOWS)
+    footer = "<i>события / уникальные пользователи (приближенно) · конверсия от /start</i>"
+    if MULTI_WORKER:
+        footer += f"\n<i>данные процесса {os.getpid()}</i>"
     await message.answer(
-        "💰 <b>Мои услуги и цены:</b>\n\n"
-        "📊 Парсинг данных — от 3 000₽\n"
-        "   • Сбор данных с сайтов\n"
-        "   • Обработка больших объемов\n"
-        "   • Регулярное обновление\n\n"
-        "📋 Автоматизация Excel — от 1 000₽\n"
-        "   • Макросы и формулы\n"
-        "   • Автоотчеты\n"
-        "   • Интеграция с системами\n\n"
-        "🤖 Telegram-бот — от 8 000₽\n"
-        "   • Индивидуальная разработка\n"
-        "   • Интеграция с API\n"
-        "   • Техподдержка\n\n"
-        "📝 <i>Каждый проект индивидуален, цена может варьироваться в зависимости от сложности.</i>",
+        "\n\n".join(format_funnel(window) for window in windows) + f"\n\n{footer}",
         parse_mode="HTML"
     )
 
-@dp.message(F.text == "🖥 Портфолио")
+@text_router.exact("📊 Услуги")
+async def show_services(message: types.Message):
+    analytics.track("services", message.from_user.id)
+    await message.answer(catalog.current.services_text, parse_mode="HTML")
+
+@text_router.exact("🖥 Портфолио")
 async def show_portfolio(message: types.Message):
+    analytics.track("portfolio", message.from_user.id)
     await message.answer(
         "📂 <b>Мои работы:</b>\n\n"
         "🔗 GitHub: https://github.com/JustProject174/JustProject_174.git\n"
@@ -210,7 +637,7 @@ async def show_portfolio(message: types.Message):
         parse_mode="HTML"
     )
 
-@dp.message(F.text == "📞 Контакты")
+@text_router.exact("📞 Контакты")
 async def show_contacts(message: types.Message):
     await message.answer(
         "📞 <b>Как со мной связаться:</b>\n\n"
@@ -226,26 +653,20 @@ async def show_contacts(message: types.Message):
         parse_mode="HTML"
     )
 
-@dp.message(F.text == "🛒 Заказать")
+@text_router.exact("🛒 Заказать")
 async def start_order(message: types.Message):
-    inline_kb = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="📊 Парсинг данных (от 3 000₽)", callback_data="order_parse")],
-            [InlineKeyboardButton(text="📋 Автоматизация Excel (от 1 000₽)", callback_data="order_excel")],
-            [InlineKeyboardButton(text="🤖 Разработка бота (от 8 000₽)", callback_data="order_bot")],
-            [InlineKeyboardButton(text="💬 Консультация (бесплатно)", callback_data="order_consultation")],
-            [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_order")]
-        ]
-    )
+    analytics.track("order_menu", message.from_user.id)
+    current = catalog.current
     await message.answer(
-        "🔍 <b>Выберите услугу для заказа:</b>\n\n"
-        "После выбора я свяжусь с вами для уточнения деталей и составления технического задания.",
-        reply_markup=inline_kb,
+        current.order_text,
+        reply_markup=current.order_keyboard,
         parse_mode="HTML"
     )
 
-@dp.callback_query(F.data == "cancel_order")
+@dp.callback_query(F.data == CANCEL_CALLBACK)
 async def cancel_order(callback: types.CallbackQuery):
+    await order_forms.discard(callback.from_user.id)
+    analytics.track("order_cancel", callback.from_user.id)
     await callback.message.edit_text(
         "❌ <b>Заказ отменен</b>\n\n"
         "Если передумаете, всегда можете вернуться через главное меню!",
@@ -253,133 +674,160 @@ async def cancel_order(callback: types.CallbackQuery):
     )
     await callback.answer()
 
-@dp.callback_query(F.data.startswith("order_"))
+@dp.callback_query(F.data.startswith(ORDER_CALLBACK_PREFIX))
 async def process_order(callback: types.CallbackQuery):
-    service_map = {
-        "order_parse": ("Парсинг данных", 3000, "📊"),
-        "order_excel": ("Автоматизация Excel", 1000, "📋"),
-        "order_bot": ("Разработка бота", 8000, "🤖"),
-        "order_consultation": ("Консультация", 0, "💬")
-    }
+    selected = catalog.current.get_service(callback.data)
 
-    if callback.data not in service_map:
+    if selected is None:
         await callback.answer("❌ Услуга не найдена!", show_alert=True)
         return
 
-    service, price, emoji = service_map[callback.data]
+    await remember_user(callback.from_user)
+    analytics.track("order_form", callback.from_user.id)
+
+    # Новая анкета заменяет незаконченную, если клиент выбрал услугу заново
+    form = OrderForm(callback.from_user.id, callback.message.chat.id, selected.id)
+    await order_forms.save(form)
+    logger.info("📝 Анкета заказа: %s для пользователя %s", selected.name, callback.from_user.id,
+                extra={"category": "order"})
+
+    await callback.answer()
+    await callback.message.edit_text(
+        f"{selected.emoji} <b>{selected.name}</b> ({selected.price_text})\n\n"
+        f"Ответьте на несколько вопросов, чтобы я сразу понял задачу.\n\n"
+        f"{form.question}",
+        reply_markup=order_cancel_keyboard,
+        parse_mode="HTML"
+    )
+
+async def order_form_filter(message: types.Message):
+    """Текст от пользователя с незаконченной анкетой; команды и кнопки меню идут обычным путем"""
+    if message.from_user is None or message.text.startswith("/") or text_router.is_exact(message.text):
+        return False
+    form = await order_forms.get(message.from_user.id)
+    return {"order_form": form} if form is not None else False
+
+async def fill_order_form(message: types.Message, order_form: OrderForm):
+    """Ответ на очередной шаг анкеты; после последнего шага заказ оформляется"""
+    order_form = await order_forms.advance(order_form, message.text)
+    if order_form is None:
+        # Анкету уже отменили или заполнили (сообщение обработал другой воркер)
+        return
+    if not order_form.is_complete:
+        await message.answer(order_form.question, reply_markup=order_cancel_keyboard, parse_mode="HTML")
+        return
+
+    selected = catalog.current.get_service(ORDER_CALLBACK_PREFIX + order_form.service_id)
+    if selected is None:
+        await message.answer(
+            "❌ Эта услуга больше недоступна. Выберите другую через «🛒 Заказать».",
+            reply_markup=main_menu
+        )
+        return
+    await submit_order(message, order_form, selected)
+
+async def submit_order(message: types.Message, form: OrderForm, selected):
+    """Запись заполненной анкеты в очередь заказов и подтверждение клиенту"""
+    service, price, emoji = selected.name, selected.price, selected.emoji
 
     order_data = {
-        "client_name": callback.from_user.full_name or "Не указано",
-        "client_id": str(callback.from_user.id),
+        "client_name": message.from_user.full_name or "Не указано",
+        "client_id": str(message.from_user.id),
         "service": service,
         "price": price,
         "status": "Новый",
-        "username": callback.from_user.username or "Не указан",
-        "comment": f"Заказ через Telegram-бота в {callback.message.date}"
+        "username": message.from_user.username or "Не указан",
+        "task": form.task,
+        "deadline": form.deadline,
+        "budget": form.budget,
+        "contact": form.contact,
+        "comment": f"Заказ через Telegram-бота в {message.date}"
     }
 
-    logger.info(f"Обработка заказа: {service} для пользователя {callback.from_user.id}")
+    logger.info("Обработка заказа: %s для пользователя %s", service, message.from_user.id,
+                extra={"category": "order"})
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                    GSHEETS_URL,
-                    json=order_data,
-                    headers={
-                        'Content-Type': 'application/json',
-                        'Accept': 'application/json'
-                    },
-                    timeout=aiohttp.ClientTimeout(total=15)
-            ) as response:
-                response_text = await response.text()
-                logger.info(f"Google Sheets ответ: {response.status} - {response_text}")
-
-                if response.status in [200, 302]:
-                    await callback.answer("✅ Заказ успешно оформлен!", show_alert=False)
-
-                    price_text = f"от {price:,}₽" if price > 0 else "Бесплатно"
-
-                    await callback.message.edit_text(
-                        f"{emoji} <b>Заказ оформлен!</b>\n\n"
-                        f"👤 <b>Клиент:</b> {order_data['client_name']}\n"
-                        f"🔧 <b>Услуга:</b> {service}\n"
-                        f"💰 <b>Стоимость:</b> {price_text}\n"
-                        f"📅 <b>Дата:</b> {callback.message.date.strftime('%d.%m.%Y %H:%M')}\n\n"
-                        f"📞 <b>Что дальше?</b>\n"
-                        f"Я свяжусь с вами в течение часа для:\n"
-                        f"• Уточнения требований\n"
-                        f"• Составления ТЗ\n"
-                        f"• Согласования сроков\n\n"
-                        f"🙏 Спасибо за выбор наших услуг!",
-                        parse_mode="HTML"
-                    )
-                else:
-                    logger.error(f"Неожиданный статус от Google Sheets: {response.status}")
-                    raise aiohttp.ClientError(f"HTTP {response.status}")
-
-    except asyncio.TimeoutError:
-        logger.error("Таймаут при отправке в Google Sheets")
-        await callback.answer("⚠ Превышено время ожидания", show_alert=True)
-        await callback.message.edit_text(
-            "⚠️ <b>Временные проблемы с сервером</b>\n\n"
-            "Заказ не был сохранен автоматически.\n"
-            "Пожалуйста, свяжитесь со мной напрямую:\n\n"
-            "📱 Telegram: @JProj_174\n"
-            "📧 Email: Projman174@yandex.ru",
-            parse_mode="HTML"
-        )
+        # Заказ сохраняется в локальный журнал, в Google Sheets его отправит фоновая очередь
+        order_id = await order_queue.enqueue(order_data)
     except Exception as e:
         logger.error(f"Ошибка при сохранении заказа: {e}", exc_info=True)
-        await callback.answer("⚠ Произошла ошибка", show_alert=True)
-        await callback.message.edit_text(
+        await message.answer(
             f"⚠️ <b>Ошибка при оформлении заказа</b>\n\n"
-            f"Техническая информация: {str(e)[:100]}...\n\n"
+            f"Техническая информация: {html.quote(str(e)[:100])}...\n\n"
             "Пожалуйста, свяжитесь со мной напрямую:\n"
             "📱 Telegram: @JProj_174\n"
             "📧 Email: Projman174@yandex.ru\n\n"
             "Мы обязательно поможем вам!",
-            parse_mode="HTML"
+            parse_mode="HTML",
+            reply_markup=main_menu
+        )
+        return
+
+    # Дальше заказ уже в журнале: ни одна ошибка ниже не должна выглядеть для клиента как неудачный заказ
+    logger.info("📥 Заказ #%s записан в очередь", order_id, extra={"category": "order"})
+    try:
+        await order_store.add(order_id, order_data)
+    except Exception as e:
+        # Заказ уйдет в Sheets; в базу для /myorders его перенесет backfill при запуске
+        logger.error(f"❌ Заказ #{order_id} не записан в базу заказов: {e}", extra={"category": "order"})
+    analytics.track("order_done", message.from_user.id)
+
+    price_text = selected.price_text.capitalize() if price == 0 else selected.price_text
+
+    try:
+        await message.answer(
+            f"{emoji} <b>Заказ #{order_id} оформлен!</b>\n\n"
+            f"👤 <b>Клиент:</b> {html.quote(order_data['client_name'])}\n"
+            f"🔧 <b>Услуга:</b> {service}\n"
+            f"💰 <b>Стоимость:</b> {price_text}\n"
+            f"📝 <b>Задача:</b> {html.quote(form.task)}\n"
+            f"📅 <b>Срок:</b> {html.quote(form.deadline)}\n"
+            f"💵 <b>Бюджет:</b> {html.quote(form.budget)}\n"
+            f"📞 <b>Контакт:</b> {html.quote(form.contact)}\n"
+            f"🗓 <b>Дата:</b> {message.date.strftime('%d.%m.%Y %H:%M')}\n\n"
+            f"📞 <b>Что дальше?</b>\n"
+            f"Я свяжусь с вами в течение часа, чтобы уточнить детали и составить ТЗ.\n\n"
+            f"🙏 Спасибо за выбор наших услуг!",
+            parse_mode="HTML",
+            reply_markup=main_menu
         )
+    except Exception as e:
+        logger.error(f"❌ Подтверждение заказа #{order_id} не отправлено: {e}", extra={"category": "order"})
 
 # Остальные обработчики сообщений остаются без изменений...
-@dp.message(F.text.lower().contains("цена") | F.text.lower().contains("стоимость") | F.text.lower().contains("сколько"))
+@text_router.keyword("цена", "стоимость", "сколько")
 async def price_question(message: types.Message):
     await message.answer(
-        "💰 <b>Цены на мои услуги:</b>\n\n"
-        "📊 Парсинг данных — от 3 000₽\n"
-        "📋 Автоматизация Excel — от 1 000₽\n"
-        "🤖 Telegram-бот — от 8 000₽\n"
-        "💬 Консультация — бесплатно\n\n"
-        "💡 <i>Итоговая стоимость зависит от сложности проекта.\n"
-        "Для точной оценки нужно обсудить техническое задание.</i>\n\n"
-        "🛒 Хотите заказать? Нажмите кнопку ниже!",
+        catalog.current.prices_text,
         parse_mode="HTML",
         reply_markup=main_menu
     )
 
-# Обработчик для отладки - показывает все входящие сообщения
-@dp.message(F.text.startswith("/"))
+# Обработчик для отладки - сюда попадают только команды, не найденные маршрутизатором
+@text_router.unknown_command
 async def debug_commands(message: types.Message):
-    """Отладочный обработчик для всех команд"""
-    logger.info(f"🔧 Получена команда: {message.text} от пользователя {message.from_user.id}")
-    
-    # Если команда не обработана другими хендлерами
-    if message.text not in ["/start", "/help", "/status", "/ping"]:
-        await message.answer(
-            f"❓ <b>Неизвестная команда:</b> <code>{message.text}</code>\n\n"
-            "📋 <b>Доступные команды:</b>\n"
-            "/start - Запустить бота\n"
-            "/help - Показать справку\n"
-            "/status - Статус бота\n"
-            "/ping - Проверка связи\n\n"
-            "Используйте кнопки меню для навигации.",
-            parse_mode="HTML",
-            reply_markup=main_menu
-        )
+    """Отладочный обработчик для неизвестных команд"""
+    logger.info("🔧 Получена команда: %s от пользователя %s", message.text, message.from_user.id,
+                extra={"category": "handler"})
+
+    await message.answer(
+        f"❓ <b>Неизвестная команда:</b> <code>{message.text}</code>\n\n"
+        "📋 <b>Доступные команды:</b>\n"
+        "/start - Запустить бота\n"
+        "/help - Показать справку\n"
+        "/status - Статус бота\n"
+        "/myorders - Мои заказы\n"
+        "/ping - Проверка связи\n\n"
+        "Используйте кнопки меню для навигации.",
+        parse_mode="HTML",
+        reply_markup=main_menu
+    )
 
-@dp.message()
+@text_router.fallback
 async def handle_unknown_message(message: types.Message):
-    logger.info(f"📝 Неизвестное сообщение: '{message.text}' от пользователя {message.from_user.id}")
+    logger.info("📝 Неизвестное сообщение: '%s' от пользователя %s", message.text, message.from_user.id,
+                extra={"category": "handler"})
     await message.answer(
         "🤔 Я не понимаю это сообщение.\n\n"
         "Воспользуйтесь кнопками меню ниже или командами:\n"
@@ -387,13 +835,74 @@ async def handle_unknown_message(message: types.Message):
         reply_markup=main_menu
     )
 
+# Текстовые сообщения - одним обработчиком, остальные (стикеры, фото) - сразу в fallback.
+# Ответы на шаги анкеты заказа перехватываются раньше маршрутизатора
+dp.message(F.text, order_form_filter)(fill_order_form)
+dp.message(F.text)(text_router.dispatch)
+dp.message()(handle_unknown_message)
+
+# Время обработчиков: маршрутизатор отчитывается сам по конечному обработчику
+text_router.observer = metrics.observe_handler
+handler_metrics = HandlerMetricsMiddleware(metrics, exclude={text_router.dispatch})
+dp.message.middleware(handler_metrics)
+dp.callback_query.middleware(handler_metrics)
+
+# Типы апдейтов, для которых есть обработчики; остальные Telegram не присылает (allowed_updates)
+ALLOWED_UPDATES = dp.resolve_used_update_types()
+
+# Разбор тела webhook сразу в Update с контекстом бота, без повторной сборки в feed_update
+update_decoder = UpdateDecoder(bot, ALLOWED_UPDATES)
+
+async def feed_update(update: types.Update):
+    """Передача апдейта в диспетчер (выполняется воркером пула)"""
+    await dp.feed_update(bot, update)
+
+# Пул воркеров: webhook сразу отвечает Telegram, обработка идет в фоне
+update_pool = UpdateWorkerPool(
+    feed_update,
+    workers=WEBHOOK_WORKERS,
+    max_queue=WEBHOOK_QUEUE_SIZE,
+    enqueue_timeout=WEBHOOK_ENQUEUE_TIMEOUT
+)
+
+# Защита от повторной доставки одного и того же апдейта
+update_dedup = UpdateDeduplicator(max_size=DEDUP_MAX_SIZE, ttl=DEDUP_TTL, db_path=DEDUP_DB, shared=MULTI_WORKER)
+
+# Общее состояние воркеров (используется только при WEBHOOK_PROCESSES > 1)
+shared_state = SharedState(SHARED_STATE_DB)
+
+metrics.gauge("bot_update_queue_depth", "Updates waiting for a worker", lambda: update_pool.depth)
+metrics.gauge("bot_update_queue_shed", "Updates rejected with 503", lambda: update_pool.shed)
+metrics.gauge("bot_updates_skipped", "Webhook updates of unhandled kinds dropped before parsing", lambda: update_decoder.skipped)
+metrics.gauge("bot_dedup_hits", "Redelivered updates skipped", lambda: update_dedup.hits)
+metrics.gauge("bot_send_waiting", "Outbound calls waiting for the global limit", lambda: send_scheduler.global_limiter.waiting)
+metrics.gauge("bot_log_dropped", "Log records dropped by category filters", lambda: sum(log_filter.dropped.values()))
+metrics.gauge("bot_webhook_pending_updates", "Updates waiting on Telegram side (cached)", lambda: runtime_info.pending_update_count)
+metrics.gauge("bot_runtime_info_age_seconds", "Age of cached webhook info", lambda: runtime_info.age_seconds or 0)
+metrics.gauge("bot_throttled_updates", "Updates dropped by the per-user rate limit", lambda: throttling.throttled)
+metrics.gauge("bot_double_taps", "Repeated callback taps answered without processing", lambda: throttling.duplicates)
+metrics.gauge("bot_order_forms_active", "Half-filled order forms", lambda: order_forms.active)
+metrics.gauge("bot_startup_phase_seconds", "Cold start duration by phase", lambda: startup_timings.phases, labelname="phase")
+metrics.gauge("bot_uptime_seconds", "Seconds since start", lambda: (datetime.now() - keep_alive.start_time).total_seconds())
+
 async def webhook_handler(request: Request):
     """Обработчик webhook от Telegram"""
+    if not update_pool.is_running:
+        # Бот останавливается (или еще не запустился): Telegram повторит доставку позже
+        return web.Response(status=503, text="Shutting down")
     try:
-        data = await request.json()
-        logger.info(f"📨 Получен webhook: {data.get('update_id', 'unknown')}")
-        update = types.Update(**data)
-        await dp.feed_update(bot, update)
+        update = update_decoder.decode(await request.read())
+        if update is None:
+            # Тип апдейта не обрабатывается (например, пришел до обновления allowed_updates)
+            return web.Response(text="OK")
+        logger.info("📨 Получен webhook: %s", update.update_id, extra={"category": "webhook"})
+        if await update_dedup.check_and_remember(update):
+            logger.info("🔁 Повторный апдейт %s пропущен", update.update_id, extra={"category": "webhook"})
+            return web.Response(text="OK")
+        if not await update_pool.submit(update):
+            # Очередь переполнена: Telegram повторит доставку позже
+            await update_dedup.forget(update)
+            return web.Response(status=503, text="Busy")
         return web.Response(text="OK")
     except Exception as e:
         logger.error(f"Ошибка webhook: {e}", exc_info=True)
@@ -402,20 +911,45 @@ async def webhook_handler(request: Request):
 async def health_check(request: Request):
     """Проверка состояния приложения с keep-alive информацией"""
     current_time = datetime.now()
-    uptime_info = f"Bot is running! Time: {current_time.strftime('%d.%m.%Y %H:%M:%S')}, Keep-alive pings: {keep_alive.ping_count}, Uptime: {keep_alive.get_uptime()}"
+    pool_stats = update_pool.get_stats()
+    uptime_info = (
+        f"Bot is running! Time: {current_time.strftime('%d.%m.%Y %H:%M:%S')}, "
+        f"Keep-alive pings: {keep_alive.ping_count}, Uptime: {keep_alive.get_uptime()}, "
+        f"Update queue: {pool_stats['depth']}/{pool_stats['max_queue']}, "
+        f"Handler latency avg: {pool_stats['latency_avg_ms']}ms, "
+        f"Pending updates: {runtime_info.pending_update_count}"
+    )
     
-    logger.info(f"🏥 Health check: {uptime_info}")
+    logger.info("🏥 Health check: %s", uptime_info, extra={"category": "health"})
     return web.Response(text=uptime_info, content_type="text/plain")
 
-async def setup_webhook():
-    """Настройка webhook для Heroku"""
+async def metrics_handler(request: Request):
+    """Метрики в текстовом формате Prometheus"""
+    return web.Response(text=metrics.render(), content_type="text/plain")
+
+def create_app():
+    """aiohttp-приложение с webhook, health check и метриками"""
+    app = web.Application()
+    app.router.add_post('/webhook', webhook_handler)
+    app.router.add_get('/health', health_check)
+    app.router.add_get('/metrics', metrics_handler)
+    return app
+
+async def setup_webhook(current_info=None):
+    """Настройка webhook для Heroku
+
+    Если webhook уже указывает на нужный адрес с теми же allowed_updates, повторная регистрация пропускается.
+    Накопившиеся за время сна апдейты не сбрасываются.
+    """
     try:
         webhook_url = f"{WEBHOOK_URL}/webhook"
-        await bot.delete_webhook(drop_pending_updates=True)
-        await bot.set_webhook(webhook_url)
-        logger.info(f"✅ Webhook установлен: {webhook_url}")
-        webhook_info = await bot.get_webhook_info()
-        logger.info(f"📊 Статус webhook: {webhook_info}")
+        if (current_info is not None and current_info.url == webhook_url
+                and set(current_info.allowed_updates or ()) == set(ALLOWED_UPDATES)):
+            logger.info(f"✅ Webhook уже установлен: {webhook_url}, ожидают {current_info.pending_update_count} апдейтов")
+            return
+        await bot.set_webhook(webhook_url, allowed_updates=ALLOWED_UPDATES, drop_pending_updates=False)
+        runtime_info.invalidate()
+        logger.info(f"✅ Webhook установлен: {webhook_url}, типы апдейтов: {', '.join(ALLOWED_UPDATES)}")
     except Exception as e:
         logger.error(f"❌ Ошибка установки webhook: {e}")
         raise
@@ -443,62 +977,289 @@ async def error_handler(event: types.ErrorEvent):
         except Exception:
             pass
 
-async def main():
-    """Главная функция запуска бота"""
-    logger.info("🚀 Запуск Telegram-бота на Heroku с keep-alive системой...")
-
-    # Получаем информацию о боте при запуске
+async def load_runtime_info():
+    """Получаем информацию о боте и webhook при запуске (get_me и get_webhook_info параллельно)"""
     try:
-        bot_info = await bot.get_me()
-        logger.info(f"🤖 Информация о боте: @{bot_info.username} (ID: {bot_info.id})")
+        await runtime_info.refresh()
+        logger.info(f"🤖 Информация о боте: @{runtime_info.username} (ID: {runtime_info.me.id})")
+        logger.info(f"📊 Статус webhook: {runtime_info.webhook_info}")
     except Exception as e:
         logger.error(f"❌ Ошибка получения информации о боте: {e}")
+    text_router.bot_username = runtime_info.username
+
+async def drain(runner):
+    """Мягкая остановка: новые webhook получают 503, принятые апдейты и отправка заказов
+    завершаются в пределах SHUTDOWN_TIMEOUT, затем закрывается HTTP-сервер"""
+    started = time.monotonic()
+    logger.info(f"🛑 Получен сигнал остановки: дообработка апдейтов и заказов (до {SHUTDOWN_TIMEOUT:.0f}с)")
+    abandoned_updates = await update_pool.drain(SHUTDOWN_TIMEOUT)
+    remaining = max(0.0, SHUTDOWN_TIMEOUT - (time.monotonic() - started))
+    pending_orders = await order_queue.drain(remaining)
+    await runner.cleanup()
+    logger.info(
+        f"✅ Дообработка завершена за {time.monotonic() - started:.2f}с: "
+        f"брошено апдейтов {abandoned_updates}, неотправленных заказов в журнале {pending_orders}"
+    )
+
+async def start_components(worker_id=None, webhook=True):
+    """Открытие хранилищ и запуск фоновых задач - общий для main() и benchmarks/bench_webhook.py
+
+    worker_id - номер процесса-воркера (см. main); webhook - запустить пул обработки апдейтов и дедупликацию.
+    """
+    is_primary = worker_id is None or worker_id == 0
+    if worker_id is not None:
+        await asyncio.to_thread(shared_state.open)
+        await keep_alive.attach_shared_state(shared_state)
+        # Per-chat лимит отправки и лимит частоты пользователя - общие для всех воркеров
+        send_scheduler.shared_state = shared_state
+        throttling.shared_state = shared_state
+        metrics.worker = worker_id
+
+    # Общий пул соединений для всех исходящих HTTP-запросов
+    await http_client.start()
+    metrics.start_loop_lag_monitor()
+    # Журнал заказов: неотправленные после перезапуска заказы уйдут в Google Sheets
+    await order_queue.start(run_flusher=is_primary)
+    await order_store.start()
+    # Реестр пользователей; незавершенная рассылка продолжится с сохраненной позиции
+    await user_registry.start()
+    await broadcaster.start(run_sender=is_primary)
+    # Воронка: у каждого воркера свой снимок
+    if worker_id is not None:
+        analytics.key = f"worker-{worker_id}"
+    await analytics.start()
+    # Незаконченные анкеты заказов из прошлого запуска
+    await order_forms.start()
+    # Горячая перезагрузка каталога при изменении файла
+    catalog.start()
+    if webhook:
+        # Воркеры обработки апдейтов
+        await update_dedup.start()
+        update_pool.start()
+
+async def stop_components(webhook=True):
+    """Остановка всего, что запускает start_components, и закрытие сессии бота"""
+    keep_alive.stop()
+    metrics.stop()
+    await runtime_info.stop()
+    await catalog.stop()
+    if webhook:
+        await update_pool.stop()
+    await update_dedup.stop()
+    await order_forms.stop()
+    await order_store.stop()
+    await broadcaster.stop()
+    await analytics.stop()
+    await user_registry.stop()
+    await order_queue.stop()
+    await http_client.close()
+    await bot.session.close()
+    shared_state.close()
+
+async def main(worker_id=None):
+    """Главная функция запуска бота
+
+    worker_id - номер процесса-воркера в многопроцессном режиме (см. run_workers);
+    webhook в этом случае уже зарегистрирован супервизором, а фоновые задачи
+    (keep-alive, отправка заказов) выполняет только воркер 0.
+    Возвращает код завершения процесса: 1, если бот остановился из-за ошибки.
+    """
+    exit_code = 0
+    is_primary = worker_id is None or worker_id == 0
+    if worker_id is None:
+        logger.info("🚀 Запуск Telegram-бота на Heroku с keep-alive системой...")
+    else:
+        logger.info(f"👷 Запуск воркера #{worker_id} (pid {os.getpid()})")
 
     try:
+        await start_components(worker_id, webhook=bool(WEBHOOK_URL))
+        startup_timings.mark("init")
+
         if WEBHOOK_URL:
             logger.info("🌐 Режим работы: Webhook")
-            await setup_webhook()
+
+            # Работаем до SIGTERM/SIGINT (перезапуск dyno, деплой, Ctrl+C), затем мягкая остановка
+            stop_event = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                loop.add_signal_handler(signum, stop_event.set)
             
             # Создаем aiohttp приложение
-            app = web.Application()
-            app.router.add_post('/webhook', webhook_handler)
-            app.router.add_get('/health', health_check)
-            
-            # Запускаем keep-alive систему в фоне
-            asyncio.create_task(keep_alive.start_keep_alive())
-            
-            # Настраиваем runner
+            app = create_app()
+
+            # Порт открывается до обращений к Bot API: разбуженный dyno сразу принимает апдейты
             runner = web.AppRunner(app)
             await runner.setup()
-            site = web.TCPSite(runner, '0.0.0.0', PORT)
-            
-            logger.info(f"🖥 Сервер запущен на порту {PORT}")
+            # reuse_port: все воркеры слушают один порт, соединения распределяет ядро
+            site = web.TCPSite(runner, '0.0.0.0', PORT, reuse_port=worker_id is not None)
             await site.start()
+            startup_timings.mark("bind")
+            logger.info(f"🖥 Сервер запущен на порту {PORT}")
+
+            await load_runtime_info()
+            if worker_id is None:
+                await setup_webhook(runtime_info.webhook_info)
+            startup_timings.mark("api")
+            logger.info(f"⏱ Холодный старт {startup_timings.total:.2f}с: {startup_timings.format()}")
+
+            # Запускаем keep-alive систему в фоне
+            if is_primary:
+                asyncio.create_task(keep_alive.start_keep_alive())
+
+            # Фоновое обновление сведений о webhook
+            runtime_info.start()
             
-            # Бесконечный цикл для поддержания работы
-            while True:
-                await asyncio.sleep(3600)  # 1 час
+            await stop_event.wait()
+            await drain(runner)
         else:
             logger.info("💻 Режим работы: Polling")
+            await load_runtime_info()
             await bot.delete_webhook(drop_pending_updates=True)
+            startup_timings.mark("api")
             
             # Запускаем keep-alive систему в фоне (для локального тестирования)
             asyncio.create_task(keep_alive.start_keep_alive())
+            runtime_info.start()
             
-            await dp.start_polling(bot)
+            await dp.start_polling(bot, allowed_updates=ALLOWED_UPDATES)
             
     except Exception as e:
         logger.critical(f"❌ Критическая ошибка при запуске: {e}", exc_info=True)
+        exit_code = 1
     finally:
-        keep_alive.stop()
-        await bot.session.close()
+        await stop_components(webhook=bool(WEBHOOK_URL))
         logger.info("🛑 Бот остановлен")
+    return exit_code
+
+
+def worker_main(worker_id):
+    """Точка входа процесса-воркера; ненулевой код завершения - падение (см. run_workers)"""
+    try:
+        sys.exit(asyncio.run(main(worker_id)))
+    except KeyboardInterrupt:
+        pass
+
+
+async def prepare_workers():
+    """Однократная подготовка в супервизоре: общее состояние и регистрация webhook"""
+    shared_state.open().reset()
+    shared_state.close()
+    try:
+        await setup_webhook(await bot.get_webhook_info())
+    finally:
+        await bot.session.close()
+
+
+def run_workers(count):
+    """Супервизор: запускает count воркеров на одном порту и перезапускает упавшие
+
+    Воркер, проработавший меньше WORKER_MIN_UPTIME, перезапускается с задержкой 1, 2, 4... секунд
+    (не больше WORKER_BACKOFF_MAX); после WORKER_MAX_FAST_FAILURES быстрых падений подряд
+    останавливаются все воркеры. Возвращает код завершения супервизора.
+    """
+    logger.info(f"🚀 Многопроцессный режим: {count} воркеров на порту {PORT}")
+    try:
+        asyncio.run(prepare_workers())
+    except Exception as e:
+        logger.critical(f"❌ Критическая ошибка при подготовке воркеров: {e}", exc_info=True)
+        return 1
+
+    # spawn: воркер заново импортирует модуль и не наследует потоки и сокеты супервизора
+    context = multiprocessing.get_context('spawn')
+    processes = {}
+    started_at = {}
+    fast_failures = dict.fromkeys(range(count), 0)
+    # worker_id -> время отложенного перезапуска
+    restart_at = {}
+    stopping = False
+    exit_code = 0
+
+    def start_worker(worker_id):
+        process = context.Process(target=worker_main, args=(worker_id,), name=f"webhook-worker-{worker_id}")
+        process.start()
+        processes[worker_id] = process
+        started_at[worker_id] = time.monotonic()
+
+    def stop_workers():
+        nonlocal stopping
+        stopping = True
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+
+    def shutdown(signum, frame):
+        logger.info(f"🛑 Сигнал {signum}: остановка воркеров")
+        stop_workers()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    for worker_id in range(count):
+        start_worker(worker_id)
+
+    while not stopping:
+        timeout = 5.0
+        if restart_at:
+            timeout = min(timeout, max(0.0, min(restart_at.values()) - time.monotonic()))
+        wait_processes(
+            [process.sentinel for worker_id, process in processes.items() if worker_id not in restart_at],
+            timeout=timeout
+        )
+        now = time.monotonic()
+        for worker_id, process in list(processes.items()):
+            if stopping:
+                break
+            if worker_id in restart_at:
+                if restart_at[worker_id] <= now:
+                    del restart_at[worker_id]
+                    start_worker(worker_id)
+                continue
+            if process.is_alive():
+                continue
+            if now - started_at[worker_id] >= WORKER_MIN_UPTIME:
+                fast_failures[worker_id] = 0
+                logger.warning(f"⚠️ Воркер #{worker_id} завершился с кодом {process.exitcode}, перезапуск")
+                start_worker(worker_id)
+                continue
+            fast_failures[worker_id] += 1
+            if fast_failures[worker_id] >= WORKER_MAX_FAST_FAILURES:
+                logger.critical(
+                    f"❌ Воркер #{worker_id} падает сразу после запуска ({fast_failures[worker_id]} раз подряд, "
+                    f"код {process.exitcode}), остановка"
+                )
+                stop_workers()
+                exit_code = 1
+                break
+            delay = min(2 ** (fast_failures[worker_id] - 1), WORKER_BACKOFF_MAX)
+            logger.warning(
+                f"⚠️ Воркер #{worker_id} завершился с кодом {process.exitcode} через "
+                f"{now - started_at[worker_id]:.1f}с, перезапуск через {delay:.0f}с"
+            )
+            restart_at[worker_id] = now + delay
+
+    # Каждый воркер сам дообрабатывает апдейты и заказы после SIGTERM
+    deadline = time.monotonic() + SHUTDOWN_TIMEOUT + 5
+    for worker_id, process in processes.items():
+        process.join(timeout=max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            logger.warning(f"⚠️ Воркер #{worker_id} не остановился вовремя, принудительное завершение")
+            process.kill()
+            process.join()
+    logger.info("🛑 Все воркеры остановлены")
+    return exit_code
+
+
+startup_timings.mark("config")
 
 
 if __name__ == '__main__':
     try:
-        asyncio.run(main())
+        if MULTI_WORKER:
+            sys.exit(run_workers(WORKER_COUNT))
+        else:
+            sys.exit(asyncio.run(main()))
     except KeyboardInterrupt:
         logger.info("🛑 Принудительная остановка бота")
     except Exception as e:
         logger.critical(f"❌ Необработанное исключение: {e}", exc_info=True)
+        sys.exit(1)
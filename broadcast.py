@@ -0,0 +1,268 @@
+import time
+import asyncio
+import logging
+import threading
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest, TelegramRetryAfter
+from send_scheduler import bulk_sends
+from sqlite_db import open_db
+
+logger = logging.getLogger(__name__)
+
+# Ошибки Bot API, после которых пользователю больше нельзя писать
+_GONE_ERRORS = ("chat not found", "user is deactivated", "bot was blocked", "peer_id_invalid")
+
+_FIELDS = ("id", "text", "parse_mode", "admin_chat_id", "progress_message_id", "status",
+           "last_user_id", "total", "sent", "failed", "blocked", "created_at")
+
+
+class Broadcast:
+    """Состояние одной рассылки"""
+
+    __slots__ = _FIELDS
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+
+class Broadcaster:
+    """Рассылка всем пользователям из UserRegistry с заданной скоростью и возобновлением после перезапуска
+
+    Адресаты перебираются по возрастанию user_id; позиция и счетчики периодически сохраняются
+    в SQLite, поэтому после перезапуска рассылка продолжается с последнего сохраненного пользователя.
+    Сообщения уходят с приоритетом PRIORITY_BULK и не задерживают ответы пользователям.
+    Отправляет один процесс (run_sender=True); остальные воркеры только создают и отменяют рассылки.
+    """
+
+    def __init__(self, registry, bot, db_path, rate=20.0, page_size=100,
+                 checkpoint_interval=2.0, progress_interval=5.0, poll_interval=5.0):
+        self.registry = registry
+        self.bot = bot
+        self.db_path = db_path
+        self.rate = rate
+        self.page_size = page_size
+        self.checkpoint_interval = checkpoint_interval
+        self.progress_interval = progress_interval
+        self.poll_interval = poll_interval
+        self.current = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def start(self, run_sender=True):
+        await asyncio.to_thread(self._open)
+        if run_sender:
+            self._task = asyncio.create_task(self._watch())
+
+    def _open(self):
+        self._conn = open_db(self.db_path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS broadcasts ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " text TEXT NOT NULL, parse_mode TEXT,"
+            " admin_chat_id INTEGER, progress_message_id INTEGER,"
+            " status TEXT NOT NULL,"
+            " last_user_id INTEGER NOT NULL DEFAULT 0,"
+            " total INTEGER NOT NULL,"
+            " sent INTEGER NOT NULL DEFAULT 0,"
+            " failed INTEGER NOT NULL DEFAULT 0,"
+            " blocked INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL,"
+            " finished_at REAL)"
+        )
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    async def create(self, text, parse_mode=None, admin_chat_id=None, progress_message_id=None):
+        """Новая рассылка; начнется, когда закончатся предыдущие"""
+        total = await asyncio.to_thread(self.registry.count_active_after)
+        rows = await asyncio.to_thread(
+            self._query,
+            "INSERT INTO broadcasts (text, parse_mode, admin_chat_id, progress_message_id, status, total, created_at) "
+            "VALUES (?, ?, ?, ?, 'running', ?, ?) RETURNING id",
+            (text, parse_mode, admin_chat_id, progress_message_id, total, time.time())
+        )
+        self._wakeup.set()
+        logger.info(f"📣 Рассылка #{rows[0][0]} создана: {total} получателей")
+        return rows[0][0]
+
+    async def cancel(self):
+        """Отмена всех незавершенных рассылок; возвращает число отмененных"""
+        rows = await asyncio.to_thread(
+            self._query,
+            "UPDATE broadcasts SET status = 'cancelled', finished_at = ? WHERE status = 'running' RETURNING id",
+            (time.time(),)
+        )
+        return len(rows)
+
+    async def latest(self):
+        rows = await asyncio.to_thread(
+            self._query, f"SELECT {', '.join(_FIELDS)} FROM broadcasts ORDER BY id DESC LIMIT 1"
+        )
+        return Broadcast(*rows[0]) if rows else None
+
+    async def remaining(self, broadcast):
+        if broadcast.status != "running":
+            return 0
+        return await asyncio.to_thread(self.registry.count_active_after, broadcast.last_user_id)
+
+    async def _watch(self):
+        """Фоновая задача: выполняет незавершенные рассылки по очереди (в том числе после перезапуска)"""
+        while True:
+            try:
+                rows = await asyncio.to_thread(
+                    self._query,
+                    f"SELECT {', '.join(_FIELDS)} FROM broadcasts WHERE status = 'running' ORDER BY id LIMIT 1"
+                )
+                if rows:
+                    await self._run(Broadcast(*rows[0]))
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка рассылки: {e}", exc_info=True)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _run(self, broadcast):
+        self.current = broadcast
+        if broadcast.last_user_id:
+            logger.info(f"📣 Рассылка #{broadcast.id} продолжается после пользователя {broadcast.last_user_id}")
+        blocked_ids = []
+        next_send = time.monotonic()
+        last_checkpoint = last_progress = time.monotonic()
+        try:
+            while broadcast.status == "running":
+                user_ids = await asyncio.to_thread(self.registry.active_after, broadcast.last_user_id, self.page_size)
+                if not user_ids:
+                    broadcast.status = "done"
+                    break
+                for user_id in user_ids:
+                    # Равномерный темп: не больше rate сообщений в секунду
+                    delay = next_send - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    next_send = max(next_send, time.monotonic()) + 1 / self.rate
+
+                    result = await self._send(broadcast, user_id)
+                    if result == "sent":
+                        broadcast.sent += 1
+                    elif result == "blocked":
+                        broadcast.blocked += 1
+                        blocked_ids.append(user_id)
+                    else:
+                        broadcast.failed += 1
+                    broadcast.last_user_id = user_id
+
+                    now = time.monotonic()
+                    if now - last_checkpoint >= self.checkpoint_interval:
+                        last_checkpoint = now
+                        await self._checkpoint(broadcast, blocked_ids)
+                        blocked_ids = []
+                        if broadcast.status != "running":
+                            break
+                    if now - last_progress >= self.progress_interval:
+                        last_progress = now
+                        await self._report(broadcast)
+        finally:
+            await self._checkpoint(broadcast, blocked_ids)
+            self.current = None
+        await self._report(broadcast)
+        logger.info(
+            f"📣 Рассылка #{broadcast.id}: {broadcast.status}, отправлено {broadcast.sent}, "
+            f"ошибок {broadcast.failed}, заблокировали {broadcast.blocked}"
+        )
+
+    async def _send(self, broadcast, user_id):
+        """Одно сообщение; RetryAfter (после повторов планировщика) - ждем и повторяем того же адресата"""
+        while True:
+            try:
+                with bulk_sends():
+                    await self.bot.send_message(user_id, broadcast.text, parse_mode=broadcast.parse_mode)
+                return "sent"
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+            except TelegramForbiddenError:
+                return "blocked"
+            except TelegramBadRequest as e:
+                if any(marker in str(e).lower() for marker in _GONE_ERRORS):
+                    return "blocked"
+                logger.warning(f"⚠️ Рассылка #{broadcast.id}: ошибка для {user_id}: {e}")
+                return "failed"
+            except Exception as e:
+                logger.warning(f"⚠️ Рассылка #{broadcast.id}: ошибка для {user_id}: {e}")
+                return "failed"
+
+    async def _checkpoint(self, broadcast, blocked_ids):
+        """Сохранение позиции и счетчиков; заодно узнаем, не отменена ли рассылка"""
+        def write():
+            if blocked_ids:
+                self.registry.mark_blocked(blocked_ids)
+            finished = time.time() if broadcast.status == "done" else None
+            rows = self._query(
+                "UPDATE broadcasts SET last_user_id = ?, sent = ?, failed = ?, blocked = ?, "
+                "status = CASE WHEN status = 'running' THEN ? ELSE status END, "
+                "finished_at = COALESCE(finished_at, ?) WHERE id = ? RETURNING status",
+                (broadcast.last_user_id, broadcast.sent, broadcast.failed, broadcast.blocked,
+                 broadcast.status, finished, broadcast.id)
+            )
+            return rows[0][0]
+        broadcast.status = await asyncio.to_thread(write)
+
+    async def format_progress(self, broadcast):
+        titles = {"running": "⏳ идет", "done": "✅ завершена", "cancelled": "⛔ отменена"}
+        return (
+            f"📣 <b>Рассылка #{broadcast.id}:</b> {titles.get(broadcast.status, broadcast.status)}\n\n"
+            f"✅ Отправлено: {broadcast.sent}\n"
+            f"❌ Ошибок: {broadcast.failed}\n"
+            f"🚫 Заблокировали бота: {broadcast.blocked}\n"
+            f"⏳ Осталось: {await self.remaining(broadcast)}"
+        )
+
+    async def _report(self, broadcast):
+        """Обновление сообщения с прогрессом у администратора"""
+        if not broadcast.admin_chat_id or not broadcast.progress_message_id:
+            return
+        try:
+            await self.bot.edit_message_text(
+                await self.format_progress(broadcast),
+                chat_id=broadcast.admin_chat_id,
+                message_id=broadcast.progress_message_id,
+                parse_mode="HTML"
+            )
+        except Exception as e:
+            logger.debug(f"Прогресс рассылки не обновлен: {e}")
+
+    def get_stats(self):
+        """Счетчики текущей рассылки"""
+        broadcast = self.current
+        if broadcast is None:
+            return {"running": False}
+        return {
+            "running": True,
+            "id": broadcast.id,
+            "sent": broadcast.sent,
+            "failed": broadcast.failed,
+            "blocked": broadcast.blocked,
+            "total": broadcast.total,
+        }
+
+    async def stop(self):
+        """Остановка отправки (позиция сохраняется) и закрытие базы"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+            self._conn = None
@@ -0,0 +1,139 @@
+import os
+import json
+import asyncio
+import logging
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+logger = logging.getLogger(__name__)
+
+ORDER_CALLBACK_PREFIX = "order_"
+CANCEL_CALLBACK = "cancel_order"
+
+
+def format_price(price):
+    """3000 -> 'от 3 000₽', 0 -> 'бесплатно'"""
+    if price > 0:
+        return f"от {price:,}₽".replace(",", " ")
+    return "бесплатно"
+
+
+class Service:
+    """Услуга из каталога"""
+
+    __slots__ = ("id", "emoji", "name", "list_name", "price", "features", "callback_data", "price_text")
+
+    def __init__(self, data):
+        self.id = data["id"]
+        self.emoji = data["emoji"]
+        self.name = data["name"]
+        self.list_name = data.get("list_name", self.name)
+        self.price = int(data["price"])
+        self.features = tuple(data.get("features", ()))
+        self.callback_data = ORDER_CALLBACK_PREFIX + self.id
+        self.price_text = format_price(self.price)
+
+
+class Catalog:
+    """Каталог услуг с заранее подготовленными текстами и клавиатурами"""
+
+    def __init__(self, data):
+        self.services = tuple(Service(item) for item in data["services"])
+        self.by_callback = {service.callback_data: service for service in self.services}
+        if len(self.by_callback) != len(self.services):
+            raise ValueError("Повторяющиеся id услуг в каталоге")
+
+        services_lines = ["💰 <b>Мои услуги и цены:</b>\n"]
+        for service in self.services:
+            if not service.features:
+                continue
+            services_lines.append(f"{service.emoji} {service.list_name} — {service.price_text}")
+            services_lines.extend(f"   • {feature}" for feature in service.features)
+            services_lines.append("")
+        services_lines.append(f"📝 <i>{data['services_note']}</i>")
+        self.services_text = "\n".join(services_lines)
+
+        prices_lines = ["💰 <b>Цены на мои услуги:</b>\n"]
+        prices_lines.extend(
+            f"{service.emoji} {service.list_name} — {service.price_text}" for service in self.services
+        )
+        prices_lines.append("")
+        prices_lines.append(f"💡 <i>{data['prices_note']}</i>\n")
+        prices_lines.append("🛒 Хотите заказать? Нажмите кнопку ниже!")
+        self.prices_text = "\n".join(prices_lines)
+
+        self.order_text = (
+            "🔍 <b>Выберите услугу для заказа:</b>\n\n"
+            f"{data['order_intro']}"
+        )
+        self.order_keyboard = InlineKeyboardMarkup(
+            inline_keyboard=[
+                [InlineKeyboardButton(
+                    text=f"{service.emoji} {service.name} ({service.price_text})",
+                    callback_data=service.callback_data
+                )]
+                for service in self.services
+            ] + [[InlineKeyboardButton(text="❌ Отмена", callback_data=CANCEL_CALLBACK)]]
+        )
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def get_service(self, callback_data):
+        return self.by_callback.get(callback_data)
+
+
+class CatalogLoader:
+    """Загрузка каталога из файла и горячая перезагрузка при изменении"""
+
+    def __init__(self, path, check_interval=5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.reload_count = 0
+        self._mtime = None
+        self._catalog = None
+        self._task = None
+
+    @property
+    def current(self) -> Catalog:
+        return self._catalog
+
+    def load(self):
+        """Синхронная загрузка (при старте); ошибка в файле прерывает запуск"""
+        mtime = os.stat(self.path).st_mtime_ns
+        self._catalog = Catalog.from_file(self.path)
+        self._mtime = mtime
+        logger.info(f"📚 Каталог загружен: {len(self._catalog.services)} услуг из {self.path}")
+
+    async def _reload_if_changed(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        # Новый каталог полностью собирается заранее и подменяется одной операцией
+        catalog = await asyncio.to_thread(Catalog.from_file, self.path)
+        self._catalog = catalog
+        self.reload_count += 1
+        logger.info(f"🔄 Каталог перезагружен: {len(catalog.services)} услуг")
+
+    async def watch(self):
+        """Фоновая проверка файла каталога"""
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self._reload_if_changed()
+            except Exception as e:
+                logger.error(f"❌ Ошибка перезагрузки каталога, используется прежняя версия: {e}")
+
+    def start(self):
+        self._task = asyncio.create_task(self.watch())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,185 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from sqlite_db import open_db
+
+logger = logging.getLogger(__name__)
+
+
+def get_dedup_keys(update):
+    """Ключи для дедупликации: update_id и id callback-запроса"""
+    keys = [f"u:{update.update_id}"]
+    if update.callback_query is not None:
+        keys.append(f"cb:{update.callback_query.id}")
+    return keys
+
+
+class UpdateDeduplicator:
+    """Ограниченный по памяти кэш уже принятых апдейтов (TTL + LRU)
+
+    shared=True - несколько процессов-воркеров: при промахе в памяти ключ сразу
+    проверяется и записывается в общую SQLite (INSERT OR IGNORE) в отдельном потоке,
+    без отложенной записи; event loop не ждет блокировку базы.
+    """
+
+    def __init__(self, max_size=10000, ttl=86400, db_path=None, flush_interval=1.0, shared=False,
+                 purge_interval=3600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.db_path = db_path
+        self.shared = shared and db_path is not None
+        self.flush_interval = flush_interval
+        # Ключи старше ttl удаляются из базы не чаще раза в purge_interval секунд
+        self.purge_interval = purge_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._pending = []
+        self._forgotten = []
+        self._purged_at = 0.0
+        self._conn = None
+        self._lock = threading.Lock()
+        self._task = None
+
+    async def start(self):
+        """Загрузка сохраненных ключей из SQLite (если включено хранение)"""
+        if not self.db_path:
+            return
+        await asyncio.to_thread(self._open_and_load)
+        self._task = asyncio.create_task(self._flusher())
+        logger.info(f"🧷 Дедупликация: загружено ключей {len(self._entries)} из {self.db_path}")
+
+    def _open_and_load(self):
+        self._conn = open_db(self.db_path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS seen_updates (key TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_seen_updates_seen_at ON seen_updates (seen_at)")
+        self._conn.execute("DELETE FROM seen_updates WHERE seen_at < ?", (time.time() - self.ttl,))
+        self._purged_at = time.monotonic()
+        rows = self._conn.execute(
+            "SELECT key, seen_at FROM seen_updates ORDER BY seen_at DESC LIMIT ?", (self.max_size,)
+        ).fetchall()
+        for key, seen_at in reversed(rows):
+            self._entries[key] = seen_at
+
+    def _is_fresh(self, key, now):
+        seen_at = self._entries.get(key)
+        if seen_at is None:
+            return False
+        if now - seen_at > self.ttl:
+            del self._entries[key]
+            return False
+        self._entries.move_to_end(key)
+        return True
+
+    async def check_and_remember(self, update):
+        """True если апдейт уже принимался; иначе запоминает его ключи"""
+        now = time.time()
+        keys = get_dedup_keys(update)
+        if any(self._is_fresh(key, now) for key in keys):
+            self.hits += 1
+            return True
+
+        if self.shared and await asyncio.to_thread(self._claim_shared, keys, now):
+            self.hits += 1
+            for key in keys:
+                self._entries[key] = now
+            self._evict()
+            return True
+
+        self.misses += 1
+        for key in keys:
+            self._entries[key] = now
+            if self._conn is not None and not self.shared:
+                self._pending.append((key, now))
+        self._evict()
+        return False
+
+    def _claim_shared(self, keys, now):
+        """True если ключ уже записан другим воркером"""
+        duplicate = False
+        with self._lock:
+            for key in keys:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO seen_updates (key, seen_at) VALUES (?, ?)", (key, now)
+                )
+                if cursor.rowcount == 0:
+                    duplicate = True
+        return duplicate
+
+    def _delete_shared(self, keys):
+        with self._lock:
+            self._conn.executemany("DELETE FROM seen_updates WHERE key = ?", [(key,) for key in keys])
+
+    def _evict(self):
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def forget(self, update):
+        """Удалить ключи апдейта (например, если он не был принят в обработку)"""
+        for key in get_dedup_keys(update):
+            self._entries.pop(key, None)
+        if self._conn is not None and self.shared:
+            await asyncio.to_thread(self._delete_shared, get_dedup_keys(update))
+        elif self._conn is not None:
+            keys = set(get_dedup_keys(update))
+            self._pending = [item for item in self._pending if item[0] not in keys]
+            self._forgotten.extend(keys)
+
+    def _write(self, items, forgotten, purge):
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO seen_updates (key, seen_at) VALUES (?, ?)", items)
+            self._conn.executemany("DELETE FROM seen_updates WHERE key = ?", [(key,) for key in forgotten])
+            if purge:
+                self._conn.execute("DELETE FROM seen_updates WHERE seen_at < ?", (time.time() - self.ttl,))
+
+    async def flush(self):
+        """Запись накопленных ключей в SQLite и периодическое удаление просроченных"""
+        if self._conn is None:
+            return
+        now = time.monotonic()
+        purge = now - self._purged_at >= self.purge_interval
+        if not (self._pending or self._forgotten or purge):
+            return
+        items, self._pending = self._pending, []
+        forgotten, self._forgotten = self._forgotten, []
+        await asyncio.to_thread(self._write, items, forgotten, purge)
+        if purge:
+            self._purged_at = now
+
+    async def _flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи ключей дедупликации: {e}")
+
+    def get_stats(self):
+        """Счетчики попаданий и промахов"""
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "persistent": self._conn is not None,
+            "shared": self.shared,
+        }
+
+    async def stop(self):
+        """Сохранение оставшихся ключей и закрытие базы"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            await self.flush()
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,92 @@
+import logging
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class HttpClient:
+    """Общий HTTP-клиент с пулом соединений для всех исходящих запросов"""
+
+    def __init__(self, limit=100, limit_per_host=10, dns_ttl=300, keepalive_timeout=30):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self._session = None
+        self.stats = {
+            "requests": 0,
+            "errors": 0,
+            "connections_created": 0,
+            "connections_reused": 0,
+            "dns_cache_hits": 0,
+            "dns_cache_misses": 0,
+        }
+
+    async def start(self):
+        """Создание сессии и пула соединений (вызывается из main())"""
+        if self._session is not None and not self._session.closed:
+            return
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_request_exception.append(self._on_request_exception)
+        trace_config.on_connection_create_end.append(self._on_connection_create)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuse)
+        trace_config.on_dns_cache_hit.append(self._on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(self._on_dns_cache_miss)
+
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_ttl,
+            use_dns_cache=True,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            trace_configs=[trace_config],
+        )
+        logger.info(
+            f"🔌 HTTP-пул создан: limit={self.limit}, limit_per_host={self.limit_per_host}, "
+            f"dns_ttl={self.dns_ttl}с, keepalive={self.keepalive_timeout}с"
+        )
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Текущая сессия; клиент должен быть запущен через start()"""
+        if self._session is None or self._session.closed:
+            raise RuntimeError("HTTP-клиент не запущен")
+        return self._session
+
+    def get_stats(self):
+        """Статистика пула соединений"""
+        stats = dict(self.stats)
+        stats["limit"] = self.limit
+        stats["limit_per_host"] = self.limit_per_host
+        stats["closed"] = self._session is None or self._session.closed
+        return stats
+
+    async def close(self):
+        """Закрытие сессии и всех соединений пула"""
+        if self._session is None or self._session.closed:
+            return
+        await self._session.close()
+        logger.info(f"🔌 HTTP-пул закрыт. Статистика: {self.get_stats()}")
+
+    async def _on_request_start(self, session, ctx, params):
+        self.stats["requests"] += 1
+
+    async def _on_request_exception(self, session, ctx, params):
+        self.stats["errors"] += 1
+
+    async def _on_connection_create(self, session, ctx, params):
+        self.stats["connections_created"] += 1
+
+    async def _on_connection_reuse(self, session, ctx, params):
+        self.stats["connections_reused"] += 1
+
+    async def _on_dns_cache_hit(self, session, ctx, params):
+        self.stats["dns_cache_hits"] += 1
+
+    async def _on_dns_cache_miss(self, session, ctx, params):
+        self.stats["dns_cache_misses"] += 1
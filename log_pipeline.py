@@ -0,0 +1,145 @@
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+# Стандартные атрибуты LogRecord; все остальное пришло через extra=... и попадает в JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+def parse_category_map(value, cast=float):
+    """'health=0.01,webhook=0.1' -> {'health': 0.01, 'webhook': 0.1}"""
+    result = {}
+    for part in (value or "").split(","):
+        name, sep, raw = part.partition("=")
+        if sep and name.strip():
+            result[name.strip()] = cast(raw.strip())
+    return result
+
+
+def parse_rate_limits(value):
+    """'health=1/60,webhook=100/1' -> {'health': (1, 60.0), 'webhook': (100, 1.0)}"""
+    def cast(raw):
+        count, _, seconds = raw.partition("/")
+        return int(count), float(seconds or 1)
+    return parse_category_map(value, cast)
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна строка JSON на запись"""
+
+    def format(self, record):
+        data = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class CategoryFilter(logging.Filter):
+    """Отключение, сэмплирование и ограничение частоты записей по категории (extra={"category": ...})"""
+
+    def __init__(self, disabled=(), sample=None, rate_limits=None):
+        super().__init__()
+        self.disabled = set(disabled)
+        self.sample = sample or {}
+        self.rate_limits = rate_limits or {}
+        self._windows = {}
+        self.dropped = {}
+
+    def _drop(self, category):
+        self.dropped[category] = self.dropped.get(category, 0) + 1
+        return False
+
+    def filter(self, record):
+        category = getattr(record, "category", None)
+        if category is None:
+            return True
+        if category in self.disabled:
+            return self._drop(category)
+
+        rate = self.sample.get(category)
+        if rate is not None and random.random() >= rate:
+            return self._drop(category)
+
+        limit = self.rate_limits.get(category)
+        if limit is not None:
+            count, period = limit
+            now = time.monotonic()
+            window_start, used = self._windows.get(category, (now, 0))
+            if now - window_start >= period:
+                window_start, used = now, 0
+            if used >= count:
+                self._windows[category] = (window_start, used)
+                return self._drop(category)
+            self._windows[category] = (window_start, used + 1)
+        return True
+
+
+class LazyQueueHandler(QueueHandler):
+    """QueueHandler без форматирования в вызывающем потоке: сообщение собирается в потоке QueueListener"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.overflow = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        # При переполнении очереди запись теряется, но event loop не блокируется
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.overflow += 1
+
+
+_listener = None
+
+
+def setup_logging(level="INFO", fmt="json", disabled=(), sample=None, rate_limits=None, queue_size=10000):
+    """Логирование через очередь: event loop только кладет запись, вывод и форматирование - в фоновом потоке"""
+    global _listener
+    stop_logging()
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = LazyQueueHandler(log_queue)
+    category_filter = CategoryFilter(disabled, sample, rate_limits)
+    queue_handler.addFilter(category_filter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return category_filter
+
+
+def stop_logging():
+    """Дописать оставшиеся записи и остановить фоновый поток"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,224 @@
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labelnames, labels, *extra):
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)]
+    parts.extend(label for label in extra if label)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Счетчик Prometheus с метками"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self, const=""):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels, const)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Гистограмма Prometheus с метками; observe() - O(log число корзин)"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+
+    def observe(self, value, *labels):
+        series = self._values.get(labels)
+        if series is None:
+            # [счетчики по корзинам (последняя - +Inf), сумма, количество]
+            series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self, const=""):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, const, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels, const)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class Gauge:
+    """Gauge, значение которого читается функцией в момент отдачи метрик
+
+    С labelname функция возвращает словарь {значение метки: значение}.
+    """
+
+    def __init__(self, name, documentation, getter, labelname=None):
+        self.name = name
+        self.documentation = documentation
+        self.getter = getter
+        self.labelname = labelname
+
+    def render(self, const=""):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        if self.labelname is None:
+            lines.append(f"{self.name}{_format_labels((), (), const)} {_format_value(self.getter())}")
+        else:
+            for label, value in self.getter().items():
+                lines.append(f"{self.name}{_format_labels((self.labelname,), (label,), const)} {_format_value(value)}")
+        return lines
+
+
+class BotMetrics:
+    """Метрики бота в текстовом формате Prometheus
+
+    В многопроцессном режиме каждый воркер считает свои метрики, а /metrics отвечает тот воркер,
+    которому досталось соединение; поэтому все серии получают метку worker (см. worker).
+    """
+
+    def __init__(self):
+        # Номер процесса-воркера; None - однопроцессный режим, метка не добавляется
+        self.worker = None
+        self.updates = Counter("bot_updates_total", "Received updates by type", ["type"])
+        self.handler_latency = Histogram(
+            "bot_handler_duration_seconds", "Handler execution time", ["handler"]
+        )
+        self.handler_errors = Counter("bot_handler_errors_total", "Handler exceptions", ["handler"])
+        self.sheets_latency = Histogram("bot_sheets_request_duration_seconds", "Google Sheets POST latency")
+        self.sheets_errors = Counter("bot_sheets_errors_total", "Failed Google Sheets POSTs")
+        self.api_latency = Histogram(
+            "bot_telegram_api_duration_seconds", "Telegram Bot API call latency", ["method"]
+        )
+        self.api_errors = Counter("bot_telegram_api_errors_total", "Failed Telegram Bot API calls", ["method"])
+        self.loop_lag = Histogram(
+            "bot_event_loop_lag_seconds", "Event loop scheduling delay",
+            buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+        )
+        self._metrics = [
+            self.updates, self.handler_latency, self.handler_errors,
+            self.sheets_latency, self.sheets_errors,
+            self.api_latency, self.api_errors, self.loop_lag,
+        ]
+        self._loop_lag_task = None
+
+    def gauge(self, name, documentation, getter, labelname=None):
+        """Регистрация gauge, вычисляемого при каждом запросе /metrics"""
+        self._metrics.append(Gauge(name, documentation, getter, labelname))
+
+    def render(self):
+        lines = []
+        const = f'worker="{self.worker}"' if self.worker is not None else ""
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render(const))
+            except Exception as e:
+                logger.error(f"❌ Ошибка формирования метрики {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+    def observe_handler(self, name, seconds, failed=False):
+        """Наблюдатель для TextRouter (см. TextRouter.observer)"""
+        self.handler_latency.observe(seconds, name)
+        if failed:
+            self.handler_errors.inc(name)
+
+    async def _measure_loop_lag(self, interval):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            self.loop_lag.observe(max(0.0, loop.time() - expected))
+
+    def start_loop_lag_monitor(self, interval=0.5):
+        self._loop_lag_task = asyncio.create_task(self._measure_loop_lag(interval))
+
+    def stop(self):
+        if self._loop_lag_task:
+            self._loop_lag_task.cancel()
+            self._loop_lag_task = None
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer-middleware на dp.update: число апдейтов по типам"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    async def __call__(self, handler, event, data):
+        try:
+            update_type = event.event_type
+        except Exception:
+            update_type = "unknown"
+        self.metrics.updates.inc(update_type)
+        return await handler(event, data)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner-middleware: время выполнения и ошибки каждого обработчика"""
+
+    def __init__(self, metrics, exclude=()):
+        self.metrics = metrics
+        # Обработчики-маршрутизаторы, которые сами отчитываются по конечным обработчикам
+        self.exclude = exclude
+
+    async def __call__(self, handler, event, data):
+        callback = data["handler"].callback
+        if callback in self.exclude:
+            return await handler(event, data)
+        name = getattr(callback, "__name__", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.metrics.handler_errors.inc(name)
+            raise
+        finally:
+            self.metrics.handler_latency.observe(time.perf_counter() - started, name)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Request-middleware сессии бота: задержка вызовов Bot API"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            self.metrics.api_errors.inc(name)
+            raise
+        finally:
+            self.metrics.api_latency.observe(time.perf_counter() - started, name)
@@ -0,0 +1,287 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from sqlite_db import open_db
+
+logger = logging.getLogger(__name__)
+
+# Шаги анкеты заказа по порядку: поле OrderForm -> вопрос клиенту
+ORDER_STEPS = (
+    ("task", "📝 Опишите задачу: что нужно сделать?"),
+    ("deadline", "📅 К какому сроку нужен результат?"),
+    ("budget", "💰 Какой у вас бюджет?"),
+    ("contact", "📞 Как с вами связаться? (телефон, email или @username)"),
+)
+MAX_ANSWER_LENGTH = 1000
+
+_FIELDS = ("user_id", "chat_id", "service_id", "step", "task", "deadline", "budget", "contact", "updated_at")
+
+
+class OrderForm:
+    """Незаполненная анкета заказа одного пользователя"""
+
+    __slots__ = _FIELDS
+
+    def __init__(self, user_id, chat_id, service_id, step=0, task=None, deadline=None,
+                 budget=None, contact=None, updated_at=None):
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.service_id = service_id
+        self.step = step
+        self.task = task
+        self.deadline = deadline
+        self.budget = budget
+        self.contact = contact
+        self.updated_at = updated_at if updated_at is not None else time.time()
+
+    @property
+    def is_complete(self):
+        return self.step >= len(ORDER_STEPS)
+
+    @property
+    def question(self):
+        """Вопрос текущего шага с номером: 'Шаг 2/4. ...'"""
+        return f"<b>Шаг {self.step + 1}/{len(ORDER_STEPS)}.</b> {ORDER_STEPS[self.step][1]}"
+
+    def answer(self, text):
+        """Записать ответ на текущий шаг и перейти к следующему"""
+        setattr(self, ORDER_STEPS[self.step][0], text.strip()[:MAX_ANSWER_LENGTH])
+        self.step += 1
+
+    def as_row(self):
+        return tuple(getattr(self, name) for name in _FIELDS)
+
+
+class OrderFormStore:
+    """Анкеты заказов в памяти: O(1) на апдейт, TTL для брошенных анкет и жесткий лимит числа записей
+
+    Записи упорядочены по времени последнего изменения, поэтому устаревшие и лишние
+    анкеты удаляются с начала словаря. С db_path изменения пачками пишутся в SQLite
+    и анкеты переживают перезапуск. shared=True - несколько процессов-воркеров:
+    память не используется, каждая операция сразу читает или пишет общую базу
+    в отдельном потоке; число активных анкет пересчитывается в фоне раз в flush_interval.
+    """
+
+    def __init__(self, max_size=10000, ttl=86400, db_path=None, flush_interval=2.0, shared=False):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.db_path = db_path
+        self.shared = shared and db_path is not None
+        self.flush_interval = flush_interval
+        self.started = 0
+        self.completed = 0
+        self.expired = 0
+        self.evictions = 0
+        self._forms = OrderedDict()
+        self._dirty = {}
+        self._shared_active = 0
+        self._conn = None
+        self._lock = threading.Lock()
+        self._task = None
+
+    async def start(self):
+        """Загрузка сохраненных анкет из SQLite (если включено хранение)"""
+        if not self.db_path:
+            return
+        await asyncio.to_thread(self._open_and_load)
+        self._task = asyncio.create_task(self._flusher())
+        logger.info(f"📝 Анкеты заказов: загружено {len(self._forms)} из {self.db_path}")
+
+    def _open_and_load(self):
+        self._conn = open_db(self.db_path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS order_forms ("
+            " user_id INTEGER PRIMARY KEY,"
+            " chat_id INTEGER NOT NULL,"
+            " service_id TEXT NOT NULL,"
+            " step INTEGER NOT NULL,"
+            " task TEXT, deadline TEXT, budget TEXT, contact TEXT,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("DELETE FROM order_forms WHERE updated_at < ?", (time.time() - self.ttl,))
+        if self.shared:
+            return
+        rows = self._conn.execute(
+            f"SELECT {', '.join(_FIELDS)} FROM order_forms ORDER BY updated_at DESC LIMIT ?", (self.max_size,)
+        ).fetchall()
+        for row in reversed(rows):
+            self._forms[row[0]] = OrderForm(*row)
+
+    async def get(self, user_id):
+        """Активная анкета пользователя или None"""
+        if self.shared:
+            return await asyncio.to_thread(self._read_shared, user_id)
+        form = self._forms.get(user_id)
+        if form is not None and time.time() - form.updated_at > self.ttl:
+            self._remove(user_id)
+            self.expired += 1
+            return None
+        return form
+
+    async def save(self, form):
+        """Новая анкета или переход на следующий шаг"""
+        if form.step == 0 and form.task is None:
+            self.started += 1
+        form.updated_at = time.time()
+        if self.shared:
+            await asyncio.to_thread(self._write, {form.user_id: form}, False)
+            return
+        self._forms[form.user_id] = form
+        self._forms.move_to_end(form.user_id)
+        if self._conn is not None:
+            self._dirty[form.user_id] = form
+        self._evict(form.updated_at)
+
+    async def advance(self, form, text):
+        """Ответ на текущий шаг; заполненная анкета удаляется из хранилища
+
+        Возвращает анкету после ответа или None, если ее уже нет (отменена или заполнена в другом
+        воркере). В многопроцессном режиме два быстрых сообщения одного чата могут обрабатываться
+        разными воркерами одновременно: шаг переключается compare-and-set по step, и проигравший
+        повторяет ответ на перечитанной анкете - ответы не затирают друг друга и шаги не пропускаются.
+        """
+        if self.shared:
+            form = await asyncio.to_thread(self._advance_shared, form, text)
+            if form is not None and form.is_complete:
+                self.completed += 1
+            return form
+        form.answer(text)
+        if form.is_complete:
+            await self.discard(form.user_id, completed=True)
+        else:
+            await self.save(form)
+        return form
+
+    def _advance_shared(self, form, text):
+        while True:
+            step = form.step
+            form.answer(text)
+            form.updated_at = time.time()
+            with self._lock:
+                if form.is_complete:
+                    cursor = self._conn.execute(
+                        "DELETE FROM order_forms WHERE user_id = ? AND step = ?", (form.user_id, step)
+                    )
+                else:
+                    field = ORDER_STEPS[step][0]
+                    cursor = self._conn.execute(
+                        f"UPDATE order_forms SET {field} = ?, step = ?, updated_at = ? WHERE user_id = ? AND step = ?",
+                        (getattr(form, field), form.step, form.updated_at, form.user_id, step)
+                    )
+            if cursor.rowcount:
+                return form
+            # Шаг уже принят другим воркером (или анкета удалена) - повтор на свежей анкете
+            form = self._read_shared(form.user_id)
+            if form is None:
+                return None
+
+    async def discard(self, user_id, completed=False):
+        """Удалить анкету (заказ оформлен или отменен)"""
+        if completed:
+            self.completed += 1
+        if self.shared:
+            await asyncio.to_thread(self._write, {user_id: None}, False)
+            return
+        self._remove(user_id)
+
+    def _remove(self, user_id):
+        if self._forms.pop(user_id, None) is not None and self._conn is not None:
+            self._dirty[user_id] = None
+
+    def _read_shared(self, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_FIELDS)} FROM order_forms WHERE user_id = ? AND updated_at >= ?",
+                (user_id, time.time() - self.ttl)
+            ).fetchone()
+        return OrderForm(*row) if row else None
+
+    def _evict(self, now):
+        """Удаление с начала словаря: сначала просроченные, затем самые давние сверх лимита"""
+        while self._forms:
+            user_id, oldest = next(iter(self._forms.items()))
+            if now - oldest.updated_at > self.ttl:
+                self.expired += 1
+            elif len(self._forms) > self.max_size:
+                self.evictions += 1
+            else:
+                break
+            self._remove(user_id)
+
+    def _write(self, items, purge=True):
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO order_forms ({', '.join(_FIELDS)}) "
+                f"VALUES ({', '.join('?' * len(_FIELDS))})",
+                [form.as_row() for form in items.values() if form is not None]
+            )
+            self._conn.executemany(
+                "DELETE FROM order_forms WHERE user_id = ?",
+                [(user_id,) for user_id, form in items.items() if form is None]
+            )
+            if purge:
+                self._conn.execute("DELETE FROM order_forms WHERE updated_at < ?", (time.time() - self.ttl,))
+
+    def _count_shared(self):
+        """Удаление брошенных анкет и число активных (многопроцессный режим)"""
+        with self._lock:
+            self._conn.execute("DELETE FROM order_forms WHERE updated_at < ?", (time.time() - self.ttl,))
+            return self._conn.execute("SELECT COUNT(*) FROM order_forms").fetchone()[0]
+
+    async def flush(self):
+        """Запись изменившихся анкет в SQLite (в многопроцессном режиме - пересчет активных анкет)"""
+        if self._conn is None:
+            return
+        if self.shared:
+            self._shared_active = await asyncio.to_thread(self._count_shared)
+            return
+        self._evict(time.time())
+        if not self._dirty:
+            return
+        items, self._dirty = self._dirty, {}
+        await asyncio.to_thread(self._write, items)
+
+    async def _flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи анкет заказов: {e}")
+
+    @property
+    def active(self):
+        """Число анкет в памяти (в многопроцессном режиме - в общей базе на момент последнего пересчета)"""
+        if self.shared:
+            return self._shared_active
+        return len(self._forms)
+
+    def get_stats(self):
+        """Счетчики анкет"""
+        return {
+            "active": self.active,
+            "max_size": self.max_size,
+            "started": self.started,
+            "completed": self.completed,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "persistent": self._conn is not None,
+            "shared": self.shared,
+        }
+
+    async def stop(self):
+        """Сохранение оставшихся изменений и закрытие базы"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            await self.flush()
+            with self._lock:
+                self._conn.close()
+            self._conn = None
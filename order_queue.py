@@ -0,0 +1,220 @@
+import json
+import time
+import asyncio
+import logging
+import threading
+from sqlite_db import open_db
+
+logger = logging.getLogger(__name__)
+
+
+class OrderQueue:
+    """Надежная очередь заказов: локальный журнал SQLite + фоновая отправка в Google Sheets"""
+
+    def __init__(self, db_path, send_order, send_batch=None, batch_size=20,
+                 flush_interval=2.0, base_backoff=5.0, max_backoff=600.0):
+        self.db_path = db_path
+        self.send_order = send_order
+        self.send_batch = send_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.is_running = False
+        self.delivered_count = 0
+        self.failed_attempts = 0
+        self.last_error = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def start(self, run_flusher=True):
+        """Открытие журнала и запуск фоновой отправки
+
+        run_flusher=False - только запись в журнал (остальные воркеры в многопроцессном режиме),
+        отправкой занимается один процесс, чтобы заказ не ушел дважды.
+        """
+        await asyncio.to_thread(self._open)
+        self.is_running = True
+        if run_flusher:
+            self._task = asyncio.create_task(self._flusher())
+        stats = await self.get_stats()
+        logger.info(f"📦 Очередь заказов запущена ({self.db_path}), в очереди: {stats['depth']}")
+
+    def _open(self):
+        self._conn = open_db(self.db_path, synchronous="FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS order_journal ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " payload TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt_at REAL NOT NULL,"
+            " delivered_at REAL,"
+            " last_error TEXT)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_order_journal_pending "
+            "ON order_journal (next_attempt_at) WHERE delivered_at IS NULL"
+        )
+
+    async def enqueue(self, order_data):
+        """Запись заказа в журнал; возвращает номер заказа"""
+        order_id = await asyncio.to_thread(self._insert, order_data)
+        self._wakeup.set()
+        return order_id
+
+    def _insert(self, order_data):
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO order_journal (payload, created_at, next_attempt_at) VALUES (?, ?, ?)",
+                (json.dumps(order_data, ensure_ascii=False), now, now)
+            )
+            return cursor.lastrowid
+
+    def _fetch_due(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, payload, attempts FROM order_journal "
+                "WHERE delivered_at IS NULL AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (time.time(), self.batch_size)
+            ).fetchall()
+
+    def _mark_delivered(self, ids):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE order_journal SET delivered_at = ?, last_error = NULL "
+                "WHERE id = ? AND delivered_at IS NULL",
+                [(now, order_id) for order_id in ids]
+            )
+
+    def _mark_failed(self, rows, error):
+        now = time.time()
+        updates = []
+        for order_id, _, attempts in rows:
+            delay = min(self.base_backoff * (2 ** attempts), self.max_backoff)
+            updates.append((now + delay, error[:500], order_id))
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE order_journal SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? "
+                "WHERE id = ?",
+                updates
+            )
+
+    def _pending_stats(self):
+        with self._lock:
+            depth, oldest = self._conn.execute(
+                "SELECT COUNT(*), MIN(created_at) FROM order_journal WHERE delivered_at IS NULL"
+            ).fetchone()
+        return depth, oldest
+
+    async def flush(self):
+        """Одна попытка отправить все готовые к отправке заказы; возвращает число доставленных"""
+        delivered_total = 0
+        while True:
+            rows = await asyncio.to_thread(self._fetch_due)
+            if not rows:
+                return delivered_total
+
+            delivered, failed, error = await self._deliver(rows)
+            if delivered:
+                await asyncio.to_thread(self._mark_delivered, delivered)
+                self.delivered_count += len(delivered)
+                delivered_total += len(delivered)
+            if failed:
+                self.failed_attempts += len(failed)
+                self.last_error = error
+                await asyncio.to_thread(self._mark_failed, failed, error)
+                logger.warning(f"⚠️ Не удалось отправить {len(failed)} заказ(ов) в Google Sheets: {error}")
+                return delivered_total
+
+    async def _deliver(self, rows):
+        """Отправка пачки заказов; возвращает (доставленные id, неотправленные строки, ошибка)"""
+        payloads = []
+        for order_id, payload, _ in rows:
+            order_data = json.loads(payload)
+            order_data["order_id"] = order_id
+            payloads.append(order_data)
+
+        if self.send_batch is not None:
+            try:
+                await self.send_batch(payloads)
+                return [row[0] for row in rows], [], None
+            except Exception as e:
+                return [], rows, str(e) or type(e).__name__
+
+        delivered = []
+        for index, (row, order_data) in enumerate(zip(rows, payloads)):
+            try:
+                await self.send_order(order_data)
+                delivered.append(row[0])
+            except Exception as e:
+                return delivered, rows[index:], str(e) or type(e).__name__
+        return delivered, [], None
+
+    async def _flusher(self):
+        """Фоновая отправка заказов с экспоненциальной задержкой при ошибках"""
+        while self.is_running:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                delivered = await self.flush()
+                if delivered:
+                    logger.info(f"📤 Отправлено в Google Sheets заказов: {delivered}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка фоновой отправки заказов: {e}", exc_info=True)
+
+    async def drain(self, timeout):
+        """Дождаться текущей отправки и попытаться отправить оставшиеся заказы за timeout секунд
+
+        Возвращает число неотправленных заказов: они остаются в журнале и уйдут после перезапуска.
+        """
+        self.is_running = False
+        if self._task is None:
+            # Отправкой занимается другой процесс
+            return 0
+        self._wakeup.set()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
+            self._task = None
+            await asyncio.wait_for(self.flush(), timeout=max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            pass
+        depth, _ = await asyncio.to_thread(self._pending_stats)
+        return depth
+
+    async def get_stats(self):
+        """Глубина очереди и задержка самого старого неотправленного заказа"""
+        depth, oldest = await asyncio.to_thread(self._pending_stats)
+        return {
+            "depth": depth,
+            "lag_seconds": round(time.time() - oldest, 1) if oldest else 0.0,
+            "delivered": self.delivered_count,
+            "failed_attempts": self.failed_attempts,
+            "last_error": self.last_error,
+        }
+
+    async def stop(self):
+        """Остановка фоновой отправки и закрытие журнала"""
+        self.is_running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._conn:
+            with self._lock:
+                self._conn.close()
+            self._conn = None
+        logger.info("🛑 Очередь заказов остановлена")
@@ -0,0 +1,146 @@
+import time
+import asyncio
+import logging
+import threading
+from sqlite_db import open_db
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = ("id", "client_id", "client_name", "username", "service", "price", "status",
+            "task", "deadline", "budget", "contact", "created_at")
+
+
+class StoredOrder:
+    """Заказ из локальной базы"""
+
+    __slots__ = _COLUMNS + ("delivered",)
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+
+class OrderStore:
+    """Локальная база заказов (SQLite, WAL) для /myorders и /orders
+
+    Хранится в одном файле с журналом OrderQueue: номер заказа - id записи журнала,
+    признак отправки в Google Sheets берется из журнала. Выборки постраничные по ключу
+    (id < последнего показанного), по индексам клиента, статуса и даты, без OFFSET.
+    """
+
+    def __init__(self, db_path, page_size=5):
+        self.db_path = db_path
+        self.page_size = page_size
+        self.queries = 0
+        self.query_time = 0.0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    async def start(self):
+        """Открытие базы и перенос заказов журнала, которых еще нет в базе (вызывать после OrderQueue.start)"""
+        imported = await asyncio.to_thread(self._open_and_backfill)
+        count = await asyncio.to_thread(self._count)
+        logger.info(f"🗂 База заказов: {count} заказов ({self.db_path}), перенесено из журнала: {imported}")
+
+    def _open_and_backfill(self):
+        self._conn = open_db(self.db_path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS orders ("
+            " id INTEGER PRIMARY KEY,"
+            " client_id INTEGER NOT NULL,"
+            " client_name TEXT, username TEXT,"
+            " service TEXT NOT NULL,"
+            " price INTEGER,"
+            " status TEXT NOT NULL,"
+            " task TEXT, deadline TEXT, budget TEXT, contact TEXT,"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_client ON orders (client_id, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_status ON orders (status, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_created ON orders (created_at)")
+
+        has_journal = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'order_journal'"
+        ).fetchone()
+        if not has_journal:
+            return 0
+        fields = ", ".join(
+            f"json_extract(payload, '$.{name}')" for name in _COLUMNS[2:-1]
+        )
+        with self._lock:
+            cursor = self._conn.execute(
+                f"INSERT INTO orders ({', '.join(_COLUMNS)}) "
+                f"SELECT id, CAST(json_extract(payload, '$.client_id') AS INTEGER), {fields}, created_at "
+                "FROM order_journal WHERE NOT EXISTS (SELECT 1 FROM orders WHERE orders.id = order_journal.id)"
+            )
+        return cursor.rowcount
+
+    def _count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+    async def add(self, order_id, order_data):
+        """Запись заказа под номером из журнала OrderQueue"""
+        await asyncio.to_thread(self._insert, order_id, order_data)
+
+    def _insert(self, order_id, order_data):
+        values = [order_id, int(order_data["client_id"])]
+        values.extend(order_data.get(name) for name in _COLUMNS[2:-1])
+        values.append(time.time())
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO orders ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                values
+            )
+
+    async def by_client(self, client_id, before_id=None):
+        """Страница заказов клиента, новые первыми; возвращает (заказы, before_id следующей страницы)"""
+        return await self.search(client_id=client_id, before_id=before_id)
+
+    async def search(self, client_id=None, status=None, day=None, before_id=None):
+        """Страница заказов с фильтром по клиенту, статусу и/или дню (day - timestamp начала суток)"""
+        conditions, params = [], []
+        if client_id is not None:
+            conditions.append("o.client_id = ?")
+            params.append(client_id)
+        if status is not None:
+            conditions.append("o.status = ?")
+            params.append(status)
+        if day is not None:
+            conditions.append("o.created_at >= ? AND o.created_at < ?")
+            params.extend((day, day + 86400))
+        if before_id is not None:
+            conditions.append("o.id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        params.append(self.page_size + 1)
+        query = (
+            f"SELECT {', '.join('o.' + name for name in _COLUMNS)}, j.delivered_at IS NOT NULL "
+            f"FROM orders o LEFT JOIN order_journal j ON j.id = o.id "
+            f"{where}ORDER BY o.id DESC LIMIT ?"
+        )
+        rows = await asyncio.to_thread(self._select, query, params)
+        orders = [StoredOrder(*row) for row in rows[:self.page_size]]
+        next_before = orders[-1].id if len(rows) > self.page_size else None
+        return orders, next_before
+
+    def _select(self, query, params):
+        started = time.perf_counter()
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        self.queries += 1
+        self.query_time += time.perf_counter() - started
+        return rows
+
+    def get_stats(self):
+        """Число выборок и среднее время выборки"""
+        return {
+            "queries": self.queries,
+            "query_avg_ms": round(self.query_time / self.queries * 1000, 2) if self.queries else 0.0,
+        }
+
+    async def stop(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+            self._conn = None
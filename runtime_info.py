@@ -0,0 +1,122 @@
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimings:
+    """Длительность фаз запуска (импорт, конфигурация, вызовы API, открытие порта)"""
+
+    def __init__(self, started):
+        self.started = started
+        self._last = started
+        self.phases = {}
+
+    def mark(self, phase):
+        """Завершить фазу: время с предыдущей отметки"""
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    @property
+    def total(self):
+        return self._last - self.started
+
+    def format(self):
+        return ", ".join(f"{phase} {seconds:.2f}с" for phase, seconds in self.phases.items())
+
+
+class RuntimeInfo:
+    """Кэш сведений о боте и webhook, обновляемый в фоне
+
+    /status, /health и метрики читают данные из памяти и не обращаются к Bot API.
+    """
+
+    def __init__(self, bot, ttl=60.0):
+        self.bot = bot
+        self.ttl = ttl
+        self.me = None
+        self.webhook_info = None
+        self.updated_at = None
+        self.last_refresh_error = None
+        self.refresh_count = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    @property
+    def username(self):
+        return self.me.username if self.me else None
+
+    @property
+    def age_seconds(self):
+        """Сколько секунд назад данные были получены; None если еще не получены"""
+        if self.updated_at is None:
+            return None
+        return time.monotonic() - self.updated_at
+
+    @property
+    def pending_update_count(self):
+        return self.webhook_info.pending_update_count if self.webhook_info else 0
+
+    @property
+    def last_error_date(self):
+        return self.webhook_info.last_error_date if self.webhook_info else None
+
+    async def refresh(self):
+        """Параллельный запрос get_me (один раз) и get_webhook_info"""
+        calls = [self.bot.get_webhook_info()]
+        if self.me is None:
+            calls.append(self.bot.get_me())
+        results = await asyncio.gather(*calls, return_exceptions=True)
+
+        errors = [result for result in results if isinstance(result, Exception)]
+        if not isinstance(results[0], Exception):
+            self.webhook_info = results[0]
+            self.updated_at = time.monotonic()
+        if len(results) > 1 and not isinstance(results[1], Exception):
+            self.me = results[1]
+        self.refresh_count += 1
+        self.last_refresh_error = str(errors[0]) if errors else None
+        if errors:
+            raise errors[0]
+
+    def invalidate(self):
+        """Данные устарели (например, после set_webhook) - фоновая задача обновит их сразу"""
+        self.updated_at = None
+        self._wakeup.set()
+
+    async def _wait(self, timeout):
+        """Пауза до следующего обновления; invalidate() прерывает ее"""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _refresher(self):
+        # Свежие данные, полученные при запуске, не запрашиваются повторно
+        age = self.age_seconds
+        if age is not None and age < self.ttl:
+            await self._wait(self.ttl - age)
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось обновить сведения о боте: {e}")
+            await self._wait(self.ttl)
+
+    def start(self):
+        """Фоновое обновление; если данных нет или они устарели, первое обновление - сразу"""
+        self._task = asyncio.create_task(self._refresher())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,193 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import contextvars
+from contextlib import contextmanager
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import AnswerCallbackQuery
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HIGH = 0    # ответы на callback-запросы
+PRIORITY_NORMAL = 1  # ответы пользователям
+PRIORITY_BULK = 2    # рассылки
+
+_send_priority = contextvars.ContextVar("send_priority", default=None)
+
+
+@contextmanager
+def bulk_sends():
+    """Все отправки внутри блока идут с низким приоритетом (для рассылок)"""
+    token = _send_priority.set(PRIORITY_BULK)
+    try:
+        yield
+    finally:
+        _send_priority.reset(token)
+
+
+class TokenBucket:
+    """Token bucket с резервированием: возвращает, сколько ждать до своей очереди"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now):
+        self.refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def is_idle(self, now):
+        self.refill(now)
+        return self.tokens >= self.capacity
+
+
+class PriorityLimiter:
+    """Глобальный лимит: при нехватке токенов первыми обслуживаются запросы с высоким приоритетом"""
+
+    def __init__(self, rate, capacity):
+        self.bucket = TokenBucket(rate, capacity)
+        self._waiters = []
+        self._counter = itertools.count()
+        self._pump = None
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    async def acquire(self, priority):
+        bucket = self.bucket
+        bucket.refill(time.monotonic())
+        if not self._waiters and bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._release_waiters())
+        await future
+
+    async def _release_waiters(self):
+        bucket = self.bucket
+        while self._waiters:
+            bucket.refill(time.monotonic())
+            if bucket.tokens < 1:
+                await asyncio.sleep((1 - bucket.tokens) / bucket.rate)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            bucket.tokens -= 1
+            future.set_result(None)
+
+
+class SendScheduler(BaseRequestMiddleware):
+    """Планировщик исходящих запросов к Telegram: глобальный и per-chat лимиты, повтор при RetryAfter
+
+    Подключается к сессии бота: bot.session.middleware(send_scheduler)
+    С shared_state (многопроцессный режим) per-chat лимит общий для всех воркеров:
+    корзины чатов хранятся в SharedState, резервирование идет в отдельном потоке.
+    """
+
+    def __init__(self, global_rate=30.0, chat_rate=1.0, chat_burst=3, max_retries=3, max_chats=10000):
+        self.global_limiter = PriorityLimiter(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._chat_buckets = {}
+        self.shared_state = None
+        self.sent = 0
+        self.sent_by_priority = [0, 0, 0]
+        self.retry_after_count = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _get_priority(self, method):
+        if isinstance(method, AnswerCallbackQuery):
+            return PRIORITY_HIGH
+        priority = _send_priority.get()
+        return PRIORITY_NORMAL if priority is None else priority
+
+    def _reserve_chat(self, chat_id, now):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.max_chats:
+                self._cleanup(now)
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket.reserve(now)
+
+    def _cleanup(self, now):
+        """Удаление полностью восстановившихся (неактивных) чатов"""
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items() if bucket.is_idle(now)]:
+            del self._chat_buckets[chat_id]
+
+    async def _wait_turn(self, method, priority):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is not None:
+            if self.shared_state is not None:
+                delay = await asyncio.to_thread(
+                    self.shared_state.reserve_token, f"chat:{chat_id}", self.chat_rate, self.chat_burst
+                )
+            else:
+                delay = self._reserve_chat(chat_id, time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await self.global_limiter.acquire(priority)
+
+    async def __call__(self, make_request, bot, method):
+        priority = self._get_priority(method)
+        limited = priority == PRIORITY_HIGH or getattr(method, "chat_id", None) is not None
+        if not limited:
+            return await make_request(bot, method)
+
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            await self._wait_turn(method, priority)
+            waited = time.monotonic() - started
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            try:
+                response = await make_request(bot, method)
+                self.sent += 1
+                self.sent_by_priority[priority] += 1
+                return response
+            except TelegramRetryAfter as e:
+                self.retry_after_count += 1
+                attempt += 1
+                if attempt > self.max_retries:
+                    self.failed += 1
+                    raise
+                logger.warning(
+                    f"⏳ RetryAfter {e.retry_after}с для {type(method).__name__}, повтор {attempt}/{self.max_retries}"
+                )
+                await asyncio.sleep(e.retry_after)
+
+    def get_stats(self):
+        """Пропускная способность и время ожидания в очереди"""
+        return {
+            "sent": self.sent,
+            "sent_high": self.sent_by_priority[PRIORITY_HIGH],
+            "sent_normal": self.sent_by_priority[PRIORITY_NORMAL],
+            "sent_bulk": self.sent_by_priority[PRIORITY_BULK],
+            "retry_after": self.retry_after_count,
+            "failed": self.failed,
+            "waiting": self.global_limiter.waiting,
+            "tracked_chats": len(self._chat_buckets),
+            "wait_avg_ms": round(self.wait_total / self.sent * 1000, 1) if self.sent else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 1),
+        }
@@ -0,0 +1,95 @@
+import time
+import logging
+import threading
+from sqlite_db import open_db
+
+logger = logging.getLogger(__name__)
+
+
+class SharedState:
+    """Общее для всех воркеров состояние (время запуска, счетчики, token bucket лимитов) в локальной SQLite
+
+    Операции - одиночные запросы к WAL-базе без fsync на каждую запись, поэтому вызываются синхронно.
+    Token bucket (reserve_token, try_take_token) вызываются на каждый запрос - только через asyncio.to_thread.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._take_count = 0
+
+    def open(self):
+        self._conn = open_db(self.db_path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS shared_values (key TEXT PRIMARY KEY, value REAL NOT NULL)")
+        # full_at - когда корзина восстановится полностью; после этого запись не нужна
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            " key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_rate_buckets_full_at ON rate_buckets (full_at)")
+        return self
+
+    @property
+    def is_open(self):
+        return self._conn is not None
+
+    def reset(self):
+        """Новый запуск супервизора: время запуска - сейчас, счетчики с нуля"""
+        with self._lock:
+            self._conn.execute("DELETE FROM shared_values")
+            self._conn.execute("DELETE FROM rate_buckets")
+            self._conn.execute("INSERT INTO shared_values (key, value) VALUES ('start_time', ?)", (time.time(),))
+
+    def get(self, key, default=0):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM shared_values WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def incr(self, key, amount=1):
+        """Атомарное увеличение счетчика; возвращает новое значение"""
+        with self._lock:
+            return self._conn.execute(
+                "INSERT INTO shared_values (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value RETURNING value",
+                (key, amount)
+            ).fetchone()[0]
+
+    def _take(self, key, rate, capacity, borrow):
+        """Списание токена под блокировкой базы; возвращает остаток (отрицательный - долг) или None"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+                tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+                taken = tokens >= 1 or borrow
+                if taken:
+                    tokens -= 1
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                    (key, tokens, now, now + (capacity - tokens) / rate)
+                )
+                if self._take_count % 1000 == 0:
+                    self._conn.execute("DELETE FROM rate_buckets WHERE full_at < ?", (now,))
+                self._take_count += 1
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return tokens if taken else None
+
+    def reserve_token(self, key, rate, capacity):
+        """Как TokenBucket.reserve, но общий для всех воркеров: сколько секунд ждать своей очереди"""
+        tokens = self._take(key, rate, capacity, borrow=True)
+        return 0.0 if tokens >= 0 else -tokens / rate
+
+    def try_take_token(self, key, rate, capacity):
+        """Токен, если он есть (без долга); False - лимит исчерпан"""
+        return self._take(key, rate, capacity, borrow=False) is not None
+
+    def close(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+            self._conn = None
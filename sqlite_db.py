@@ -0,0 +1,17 @@
+import os
+import sqlite3
+
+
+def open_db(db_path, synchronous="NORMAL"):
+    """Соединение с SQLite для работы из потоков (asyncio.to_thread): WAL, автокоммит, ожидание блокировки 10с
+
+    Каталог базы создается при необходимости. Соединение общее для потоков,
+    поэтому вызывающий сериализует обращения своим threading.Lock.
+    """
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={synchronous}")
+    return conn
@@ -0,0 +1,28 @@
+import os
+import sys
+import time
+import pytest
+
+# Модули бота лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Clock:
+    """Подменяемое time.time(): тест двигает время вручную (clock.now += секунды)"""
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(request, monkeypatch):
+    """Часы для time.time(); начальное время - параметр фикстуры (indirect), по умолчанию 1_000_000
+
+    time.monotonic не подменяется: на нем работают таймеры event loop.
+    """
+    clock = Clock(getattr(request, "param", 1_000_000.0))
+    monkeypatch.setattr(time, "time", clock)
+    return clock
@@ -0,0 +1,114 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from dedup import UpdateDeduplicator, get_dedup_keys
+
+
+def make_update(update_id, callback_id=None):
+    callback_query = SimpleNamespace(id=callback_id) if callback_id is not None else None
+    return SimpleNamespace(update_id=update_id, callback_query=callback_query)
+
+
+def seen(deduplicator, update):
+    return asyncio.run(deduplicator.check_and_remember(update))
+
+
+def test_keys_include_callback_id():
+    assert get_dedup_keys(make_update(7)) == ["u:7"]
+    assert get_dedup_keys(make_update(7, "abc")) == ["u:7", "cb:abc"]
+
+
+def test_repeated_update_is_duplicate(clock):
+    deduplicator = UpdateDeduplicator()
+    assert seen(deduplicator, make_update(1)) is False
+    assert seen(deduplicator, make_update(1)) is True
+    assert seen(deduplicator, make_update(2)) is False
+    assert (deduplicator.hits, deduplicator.misses) == (1, 2)
+
+
+def test_same_callback_in_new_update_is_duplicate(clock):
+    deduplicator = UpdateDeduplicator()
+    assert seen(deduplicator, make_update(1, "abc")) is False
+    assert seen(deduplicator, make_update(2, "abc")) is True
+
+
+@pytest.mark.parametrize("clock", [0.0, 1_700_000_000.5], indirect=True)
+def test_key_expires_after_ttl(clock):
+    deduplicator = UpdateDeduplicator(ttl=60)
+    seen(deduplicator, make_update(1))
+
+    clock.now += 60
+    assert seen(deduplicator, make_update(1)) is True
+
+    # Повторное попадание не продлевает ключ: отсчет от первого приема
+    clock.now += 1
+    assert seen(deduplicator, make_update(1)) is False
+    assert deduplicator.get_stats()["size"] == 1
+
+
+def test_least_recently_seen_key_is_evicted(clock):
+    deduplicator = UpdateDeduplicator(max_size=2)
+    seen(deduplicator, make_update(1))
+    seen(deduplicator, make_update(2))
+    # Попадание переносит ключ в конец очереди вытеснения
+    assert seen(deduplicator, make_update(1)) is True
+
+    seen(deduplicator, make_update(3))
+    assert deduplicator.evictions == 1
+    assert deduplicator.get_stats()["size"] == 2
+    assert seen(deduplicator, make_update(1)) is True
+    assert seen(deduplicator, make_update(2)) is False
+
+
+def test_forget_allows_redelivery(clock):
+    deduplicator = UpdateDeduplicator()
+    update = make_update(1, "abc")
+    seen(deduplicator, update)
+    asyncio.run(deduplicator.forget(update))
+    assert seen(deduplicator, update) is False
+
+
+def test_keys_survive_restart(tmp_path, clock):
+    db_path = str(tmp_path / "dedup.db")
+
+    async def session(*updates, forget=None):
+        deduplicator = UpdateDeduplicator(db_path=db_path, ttl=60)
+        await deduplicator.start()
+        try:
+            if forget is not None:
+                await deduplicator.forget(forget)
+            return [await deduplicator.check_and_remember(update) for update in updates]
+        finally:
+            await deduplicator.stop()
+
+    assert asyncio.run(session(make_update(1), make_update(2))) == [False, False]
+    assert asyncio.run(session(make_update(1), forget=make_update(2))) == [True]
+    assert asyncio.run(session(make_update(2))) == [False]
+
+    # Просроченные ключи удаляются из базы при запуске
+    clock.now += 61
+    assert asyncio.run(session(make_update(1))) == [False]
+
+
+def test_shared_mode_sees_keys_of_other_worker(tmp_path, clock):
+    db_path = str(tmp_path / "dedup.db")
+
+    async def scenario():
+        first = UpdateDeduplicator(db_path=db_path, shared=True)
+        second = UpdateDeduplicator(db_path=db_path, shared=True)
+        await first.start()
+        await second.start()
+        try:
+            results = [
+                await first.check_and_remember(make_update(1)),
+                await second.check_and_remember(make_update(1)),
+            ]
+            await first.forget(make_update(1))
+            second._entries.clear()
+            results.append(await second.check_and_remember(make_update(1)))
+            return results
+        finally:
+            await first.stop()
+            await second.stop()
+
+    assert asyncio.run(scenario()) == [False, True, False]
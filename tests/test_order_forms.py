@@ -0,0 +1,79 @@
+import asyncio
+from order_forms import OrderForm, OrderFormStore, ORDER_STEPS
+
+
+def test_form_steps_through_all_questions(clock):
+    store = OrderFormStore()
+
+    async def scenario():
+        await store.save(OrderForm(user_id=1, chat_id=1, service_id="bot"))
+        answers = []
+        for text in ("лендинг", "неделя", "50к", "@client"):
+            form = await store.advance(await store.get(1), text)
+            answers.append(form.step)
+        return answers, form
+
+    steps, form = asyncio.run(scenario())
+    assert steps == [1, 2, 3, 4]
+    assert (form.task, form.deadline, form.budget, form.contact) == ("лендинг", "неделя", "50к", "@client")
+    assert asyncio.run(store.get(1)) is None
+    assert (store.started, store.completed) == (1, 1)
+
+
+def test_form_expires_after_ttl(clock):
+    store = OrderFormStore(ttl=60)
+    asyncio.run(store.save(OrderForm(user_id=1, chat_id=1, service_id="bot")))
+    clock.now += 61
+    assert asyncio.run(store.get(1)) is None
+    assert store.expired == 1
+
+
+def test_concurrent_answers_in_shared_mode_do_not_skip_steps(tmp_path, clock):
+    db_path = str(tmp_path / "forms.db")
+
+    async def scenario():
+        first = OrderFormStore(db_path=db_path, shared=True)
+        second = OrderFormStore(db_path=db_path, shared=True)
+        await first.start()
+        await second.start()
+        try:
+            await first.save(OrderForm(user_id=1, chat_id=1, service_id="bot"))
+            # Два быстрых сообщения в разных воркерах: оба прочитали анкету на шаге 0
+            stale_first, stale_second = await first.get(1), await second.get(1)
+            after_first = await first.advance(stale_first, "лендинг")
+            after_second = await second.advance(stale_second, "неделя")
+            stored = await first.get(1)
+            return after_first, after_second, stored
+        finally:
+            await first.stop()
+            await second.stop()
+
+    after_first, after_second, stored = asyncio.run(scenario())
+    assert (after_first.step, after_second.step, stored.step) == (1, 2, 2)
+    assert (stored.task, stored.deadline) == ("лендинг", "неделя")
+
+
+def test_last_answer_completes_form_once_in_shared_mode(tmp_path, clock):
+    db_path = str(tmp_path / "forms.db")
+    last = len(ORDER_STEPS) - 1
+
+    async def scenario():
+        first = OrderFormStore(db_path=db_path, shared=True)
+        second = OrderFormStore(db_path=db_path, shared=True)
+        await first.start()
+        await second.start()
+        try:
+            await first.save(OrderForm(user_id=1, chat_id=1, service_id="bot", step=last,
+                                       task="лендинг", deadline="неделя", budget="50к"))
+            stale_first, stale_second = await first.get(1), await second.get(1)
+            return (await first.advance(stale_first, "@client"), await second.advance(stale_second, "@other"),
+                    await second.get(1), first.completed + second.completed)
+        finally:
+            await first.stop()
+            await second.stop()
+
+    completed, duplicate, stored, completed_count = asyncio.run(scenario())
+    assert completed.is_complete and completed.contact == "@client"
+    # Вторая копия сообщения не оформляет заказ повторно
+    assert duplicate is None and stored is None
+    assert completed_count == 1
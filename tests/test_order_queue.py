@@ -0,0 +1,129 @@
+import asyncio
+from order_queue import OrderQueue
+
+
+class FakeSheets:
+    """send_order / send_batch с заданным числом ошибок подряд"""
+
+    def __init__(self, failures=0, fail_on=None):
+        self.failures = failures
+        self.fail_on = fail_on
+        self.sent = []
+        self.batches = []
+
+    async def send_order(self, order_data):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Sheets недоступен")
+        if self.fail_on is not None and order_data["order_id"] == self.fail_on:
+            raise RuntimeError(f"заказ {self.fail_on} отклонен")
+        self.sent.append(order_data)
+
+    async def send_batch(self, payloads):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Sheets недоступен")
+        self.batches.append(payloads)
+        self.sent.extend(payloads)
+
+
+def run(queue, *steps):
+    """Открыть журнал (без фоновой задачи), выполнить шаги и закрыть"""
+    async def scenario():
+        await queue.start(run_flusher=False)
+        try:
+            return [await step() for step in steps]
+        finally:
+            await queue.stop()
+    return asyncio.run(scenario())
+
+
+def journal(queue):
+    queue._open()
+    try:
+        return queue._conn.execute(
+            "SELECT id, attempts, next_attempt_at, delivered_at, last_error FROM order_journal ORDER BY id"
+        ).fetchall()
+    finally:
+        queue._conn.close()
+        queue._conn = None
+
+
+def test_flush_delivers_and_marks_orders(tmp_path, clock):
+    sheets = FakeSheets()
+    queue = OrderQueue(str(tmp_path / "orders.db"), sheets.send_order)
+
+    ids = run(queue, lambda: queue.enqueue({"service": "бот"}), lambda: queue.enqueue({"service": "сайт"}))
+    delivered = run(queue, queue.flush, queue.flush)
+
+    assert delivered == [2, 0]
+    assert [order["order_id"] for order in sheets.sent] == ids
+    assert sheets.sent[0]["service"] == "бот"
+    assert all(row[3] == clock.now and row[4] is None for row in journal(queue))
+    assert queue.delivered_count == 2
+
+
+def test_failed_order_is_retried_after_backoff(tmp_path, clock):
+    sheets = FakeSheets(failures=2)
+    queue = OrderQueue(str(tmp_path / "orders.db"), sheets.send_order, base_backoff=5.0, max_backoff=600.0)
+    run(queue, lambda: queue.enqueue({"service": "бот"}))
+
+    assert run(queue, queue.flush) == [0]
+    (_, attempts, next_attempt_at, delivered_at, last_error), = journal(queue)
+    assert (attempts, next_attempt_at, delivered_at) == (1, clock.now + 5.0, None)
+    assert last_error == "Sheets недоступен"
+
+    # До истечения задержки заказ не отправляется повторно
+    clock.now += 4.0
+    assert run(queue, queue.flush) == [0]
+    assert journal(queue)[0][1] == 1
+
+    # Вторая ошибка - задержка удваивается
+    clock.now += 1.0
+    assert run(queue, queue.flush) == [0]
+    assert journal(queue)[0][1:3] == (2, clock.now + 10.0)
+
+    clock.now += 10.0
+    assert run(queue, queue.flush) == [1]
+    assert journal(queue)[0][3] == clock.now
+    assert queue.failed_attempts == 2
+
+
+def test_backoff_is_capped(tmp_path, clock):
+    queue = OrderQueue(str(tmp_path / "orders.db"), FakeSheets(failures=10).send_order,
+                       base_backoff=5.0, max_backoff=30.0)
+    run(queue, lambda: queue.enqueue({"service": "бот"}))
+    delays = []
+    for _ in range(5):
+        run(queue, queue.flush)
+        next_attempt_at = journal(queue)[0][2]
+        delays.append(next_attempt_at - clock.now)
+        clock.now = next_attempt_at
+    assert delays == [5.0, 10.0, 20.0, 30.0, 30.0]
+
+
+def test_partial_failure_keeps_order_and_rest_of_batch(tmp_path, clock):
+    sheets = FakeSheets(fail_on=2)
+    queue = OrderQueue(str(tmp_path / "orders.db"), sheets.send_order)
+    run(queue, *[lambda: queue.enqueue({"service": "бот"})] * 3)
+
+    assert run(queue, queue.flush) == [1]
+    rows = journal(queue)
+    assert rows[0][3] == clock.now
+    # Заказ с ошибкой и следующие за ним ждут повтора с одинаковой задержкой
+    assert [row[1:4] for row in rows[1:]] == [(1, clock.now + 5.0, None)] * 2
+    assert [order["order_id"] for order in sheets.sent] == [1]
+
+
+def test_batch_send_is_all_or_nothing(tmp_path, clock):
+    sheets = FakeSheets(failures=1)
+    queue = OrderQueue(str(tmp_path / "orders.db"), sheets.send_order, send_batch=sheets.send_batch, batch_size=2)
+    run(queue, *[lambda: queue.enqueue({"service": "бот"})] * 3)
+
+    assert run(queue, queue.flush) == [0]
+    assert [row[1] for row in journal(queue)] == [1, 1, 0]
+
+    clock.now += 5.0
+    assert run(queue, queue.flush) == [3]
+    assert [[order["order_id"] for order in batch] for batch in sheets.batches] == [[1, 2], [3]]
+    assert all(row[3] is not None for row in journal(queue))
@@ -0,0 +1,85 @@
+import pytest
+from shared_state import SharedState
+
+
+@pytest.fixture
+def workers(tmp_path, clock):
+    """Два экземпляра SharedState на одном файле - как в двух процессах-воркерах"""
+    db_path = str(tmp_path / "shared_state.db")
+    first, second = SharedState(db_path).open(), SharedState(db_path).open()
+    first.reset()
+    yield first, second
+    first.close()
+    second.close()
+
+
+def bucket_keys(state):
+    return [row[0] for row in state._conn.execute("SELECT key FROM rate_buckets ORDER BY key")]
+
+
+def test_counters_are_shared(workers, clock):
+    first, second = workers
+    assert first.incr("ping_count") == 1
+    assert second.incr("ping_count") == 2
+    assert second.get("start_time") == clock.now
+    assert second.get("missing", default=7) == 7
+
+
+def test_reserve_spreads_calls_of_both_workers(workers, clock):
+    first, second = workers
+    # Емкость 3, 1 токен в секунду: три вызова сразу, дальше очередь через секунду
+    delays = [worker.reserve_token("chat:1", 1.0, 3) for worker in (first, second) * 3]
+    assert delays == [0.0, 0.0, 0.0, 1.0, 2.0, 3.0]
+
+
+def test_reserved_debt_is_repaid_over_time(workers, clock):
+    first, second = workers
+    for _ in range(4):
+        first.reserve_token("chat:1", 2.0, 2)
+    # Четыре вызова при емкости 2 - долг 2 токена; пятый встает в очередь за ним: 3 токена / 2 в секунду
+    assert second.reserve_token("chat:1", 2.0, 2) == 1.5
+    # Через секунду долг 1 токен, новый вызов ждет 2 токена
+    clock.now += 1.0
+    assert first.reserve_token("chat:1", 2.0, 2) == 1.0
+
+
+def test_try_take_refuses_when_empty_and_refills(workers, clock):
+    first, second = workers
+    taken = [worker.try_take_token("user:1", 1.0, 2) for worker in (first, second, first)]
+    assert taken == [True, True, False]
+    # Отказ не уходит в долг: через секунду ровно один токен
+    clock.now += 1.0
+    assert [second.try_take_token("user:1", 1.0, 2), first.try_take_token("user:1", 1.0, 2)] == [True, False]
+
+
+def test_buckets_are_independent(workers, clock):
+    first, second = workers
+    assert first.try_take_token("user:1", 1.0, 1) is True
+    assert second.try_take_token("user:2", 1.0, 1) is True
+    assert first.try_take_token("user:1", 1.0, 1) is False
+
+
+def test_full_buckets_are_purged(workers, clock):
+    first, second = workers
+    first.try_take_token("user:1", 1.0, 5)
+    second.try_take_token("user:2", 1.0, 5)
+    assert bucket_keys(first) == ["user:1", "user:2"]
+
+    # Первый вызов после перезапуска удаляет корзины, которые уже восстановились полностью
+    clock.now += 1.5
+    restarted = SharedState(first.db_path).open()
+    try:
+        restarted.try_take_token("user:3", 1.0, 5)
+        assert bucket_keys(restarted) == ["user:3"]
+    finally:
+        restarted.close()
+
+
+def test_reset_clears_buckets_and_counters(workers, clock):
+    first, second = workers
+    second.incr("ping_count")
+    second.try_take_token("user:1", 1.0, 1)
+    clock.now += 10
+    first.reset()
+    assert (second.get("ping_count"), second.get("start_time")) == (0, clock.now)
+    assert bucket_keys(second) == []
@@ -0,0 +1,104 @@
+import re
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TextRouter:
+    """Маршрутизация текстовых сообщений за один проход вместо цепочки фильтров aiogram
+
+    Порядок: команды -> точные совпадения (кнопки меню) -> ключевые слова -> fallback.
+    Текст приводится к нижнему регистру один раз.
+    """
+
+    def __init__(self):
+        self.bot_username = None
+        # observer(имя обработчика, секунды, была ли ошибка) - для метрик
+        self.observer = None
+        self._commands = {}
+        self._exact = {}
+        self._keywords = {}
+        self._keyword_pattern = None
+        self._unknown_command = None
+        self._fallback = None
+
+    def command(self, *names):
+        """Обработчик команды: /name, /name@bot, /name аргументы"""
+        def decorator(handler):
+            for name in names:
+                self._commands[name.lower()] = handler
+            return handler
+        return decorator
+
+    def exact(self, *texts):
+        """Обработчик точного совпадения текста (без учета регистра)"""
+        def decorator(handler):
+            for text in texts:
+                self._exact[text.lower()] = handler
+            return handler
+        return decorator
+
+    def keyword(self, *words):
+        """Обработчик для сообщений, содержащих любое из слов"""
+        def decorator(handler):
+            for word in words:
+                self._keywords[word.lower()] = handler
+            # Все ключевые слова ищутся одним проходом скомпилированного регулярного выражения
+            alternatives = sorted(self._keywords, key=len, reverse=True)
+            self._keyword_pattern = re.compile("|".join(map(re.escape, alternatives)))
+            return handler
+        return decorator
+
+    def unknown_command(self, handler):
+        self._unknown_command = handler
+        return handler
+
+    def fallback(self, handler):
+        self._fallback = handler
+        return handler
+
+    def is_exact(self, text):
+        """Есть ли обработчик точного совпадения (например, кнопка меню)"""
+        return text.lower().strip() in self._exact
+
+    def resolve(self, text):
+        """Найти обработчик для текста сообщения"""
+        lowered = text.lower()
+
+        if lowered.startswith("/"):
+            parts = lowered[1:].split(maxsplit=1)
+            name, _, mention = (parts[0] if parts else "").partition("@")
+            # Команда, адресованная другому боту в группе
+            if mention and self.bot_username and mention != self.bot_username.lower():
+                return None
+            return self._commands.get(name, self._unknown_command)
+
+        handler = self._exact.get(lowered.strip())
+        if handler is not None:
+            return handler
+
+        if self._keyword_pattern is not None:
+            match = self._keyword_pattern.search(lowered)
+            if match is not None:
+                return self._keywords[match.group()]
+
+        return self._fallback
+
+    async def dispatch(self, message):
+        """Единая точка входа для текстовых сообщений"""
+        handler = self.resolve(message.text)
+        if handler is None:
+            return None
+        if self.observer is None:
+            return await handler(message)
+
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await handler(message)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.observer(handler.__name__, time.perf_counter() - started, failed)
@@ -0,0 +1,133 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from aiogram import BaseMiddleware
+from aiogram.types import Message, CallbackQuery
+from send_scheduler import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Outer-middleware для сообщений и callback-запросов: лимит частоты на пользователя и защита от двойных нажатий
+
+    - token bucket на пользователя (rate в секунду, burst подряд); лишние апдейты отбрасываются
+      до фильтров и обработчиков, пользователь получает одно предупреждение на серию;
+    - одинаковый callback_data от того же пользователя, пока первый еще обрабатывается
+      или обработан менее repeat_window секунд назад, сразу получает ответ "уже обрабатывается".
+
+    Память ограничена: записи хранятся в OrderedDict по времени последнего использования,
+    неактивные дольше idle_ttl и лишние сверх max_users удаляются с начала.
+    С shared_state (многопроцессный режим) лимит частоты общий для всех воркеров (SharedState,
+    в отдельном потоке); защита от двойных нажатий остается в памяти воркера.
+    """
+
+    def __init__(self, rate=1.0, burst=5, max_users=10000, idle_ttl=300.0,
+                 repeat_window=3.0, in_flight_ttl=60.0):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self.repeat_window = repeat_window
+        self.in_flight_ttl = in_flight_ttl
+        self.throttled = 0
+        self.duplicates = 0
+        self.evictions = 0
+        self.shared_state = None
+        # user_id -> [TokenBucket, предупреждение уже отправлено]
+        self._buckets = OrderedDict()
+        # (user_id, callback_data) -> время, до которого повтор считается двойным нажатием
+        self._in_flight = OrderedDict()
+
+    async def __call__(self, handler, event, data):
+        user = getattr(event, "from_user", None)
+        if user is None:
+            return await handler(event, data)
+        now = time.monotonic()
+        self._cleanup(now)
+
+        if not await self._allow(user.id, now):
+            self.throttled += 1
+            await self._reject(event, user.id)
+            return None
+
+        if not isinstance(event, CallbackQuery) or not event.data:
+            return await handler(event, data)
+
+        key = (user.id, event.data)
+        expires_at = self._in_flight.get(key)
+        if expires_at is not None and expires_at > now:
+            self.duplicates += 1
+            logger.info("🖐 Повторное нажатие %s от пользователя %s", event.data, user.id,
+                        extra={"category": "handler"})
+            await event.answer("⏳ Уже обрабатываю, подождите...")
+            return None
+
+        self._in_flight[key] = now + self.in_flight_ttl
+        self._in_flight.move_to_end(key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight[key] = time.monotonic() + self.repeat_window
+            self._in_flight.move_to_end(key)
+
+    async def _allow(self, user_id, now):
+        entry = self._buckets.get(user_id)
+        if entry is None:
+            entry = self._buckets[user_id] = [TokenBucket(self.rate, self.burst), False]
+        else:
+            self._buckets.move_to_end(user_id)
+        bucket = entry[0]
+        bucket.refill(now)
+        if self.shared_state is not None:
+            # Локальная корзина нужна только для учета активности (см. _cleanup)
+            allowed = await asyncio.to_thread(self.shared_state.try_take_token, f"user:{user_id}", self.rate, self.burst)
+        else:
+            allowed = bucket.tokens >= 1
+            if allowed:
+                bucket.tokens -= 1
+        if allowed:
+            entry[1] = False
+        return allowed
+
+    async def _reject(self, event, user_id):
+        entry = self._buckets[user_id]
+        if isinstance(event, CallbackQuery):
+            # Callback-запрос нужно закрыть в любом случае, иначе у пользователя крутятся часики
+            await event.answer("⏳ Слишком часто, попробуйте через пару секунд")
+        elif isinstance(event, Message) and not entry[1]:
+            await event.answer("⏳ Слишком много сообщений подряд, подождите немного")
+        if not entry[1]:
+            entry[1] = True
+            logger.info("🚦 Пользователь %s ограничен по частоте", user_id, extra={"category": "handler"})
+
+    def _cleanup(self, now):
+        """Удаление с начала словарей: неактивные, просроченные и лишние сверх лимита"""
+        buckets = self._buckets
+        while buckets:
+            bucket = next(iter(buckets.values()))[0]
+            if now - bucket.updated > self.idle_ttl:
+                buckets.popitem(last=False)
+            elif len(buckets) > self.max_users:
+                buckets.popitem(last=False)
+                self.evictions += 1
+            else:
+                break
+
+        in_flight = self._in_flight
+        while in_flight:
+            if next(iter(in_flight.values())) <= now or len(in_flight) > self.max_users:
+                in_flight.popitem(last=False)
+            else:
+                break
+
+    def get_stats(self):
+        """Счетчики отброшенных апдейтов и размер состояния"""
+        return {
+            "users": len(self._buckets),
+            "in_flight": len(self._in_flight),
+            "throttled": self.throttled,
+            "duplicates": self.duplicates,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,67 @@
+import re
+import json
+import logging
+from aiogram.types import Update
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен: без него используется стандартный json
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Telegram присылает update_id первым полем, вторым - тип апдейта: {"update_id":1,"message":{...}}
+_KIND_PATTERN = re.compile(rb'\A\s*\{\s*"update_id"\s*:\s*(\d+)\s*,\s*"([a-z_]+)"')
+
+
+def loads(data):
+    """JSON из байтов: orjson, если установлен"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class UpdateDecoder:
+    """Разбор тела webhook в types.Update за один проход
+
+    - тип апдейта определяется по первым байтам тела; неподдерживаемые типы отбрасываются
+      без разбора JSON и построения модели;
+    - поддерживаемые валидируются pydantic прямо из байтов сразу с контекстом бота,
+      поэтому Dispatcher.feed_update не пересобирает апдейт повторно (model_dump + model_validate);
+    - если тело начинается не так, как ожидается, - запасной путь через loads() и словарь.
+    """
+
+    def __init__(self, bot, allowed_updates):
+        self.bot = bot
+        self.allowed_updates = frozenset(allowed_updates)
+        self.decoded = 0
+        self.skipped = 0
+        self.fallback = 0
+        self._context = {"bot": bot}
+
+    def decode(self, body):
+        """Update или None, если тип апдейта не обрабатывается ботом"""
+        match = _KIND_PATTERN.match(body)
+        if match is not None:
+            if match.group(2).decode() not in self.allowed_updates:
+                self.skipped += 1
+                return None
+            self.decoded += 1
+            return Update.model_validate_json(body, context=self._context)
+
+        self.fallback += 1
+        data = loads(body)
+        if not any(kind in data for kind in self.allowed_updates):
+            self.skipped += 1
+            return None
+        self.decoded += 1
+        return Update.model_validate(data, context=self._context)
+
+    def get_stats(self):
+        """Счетчики разобранных и отброшенных апдейтов"""
+        return {
+            "decoded": self.decoded,
+            "skipped": self.skipped,
+            "fallback": self.fallback,
+            "orjson": orjson is not None,
+        }
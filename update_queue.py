@@ -0,0 +1,133 @@
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def get_chat_key(update):
+    """Ключ для последовательной обработки: id чата, иначе id пользователя, иначе update_id"""
+    for field in ("message", "edited_message", "channel_post", "edited_channel_post",
+                  "callback_query", "inline_query", "chosen_inline_result",
+                  "my_chat_member", "chat_member", "chat_join_request"):
+        event = getattr(update, field, None)
+        if event is None:
+            continue
+        chat = getattr(event, "chat", None)
+        if chat is None:
+            message = getattr(event, "message", None)
+            chat = getattr(message, "chat", None)
+        if chat is not None:
+            return chat.id
+        user = getattr(event, "from_user", None)
+        if user is not None:
+            return user.id
+    return update.update_id
+
+
+class UpdateWorkerPool:
+    """Пул воркеров для обработки апдейтов после быстрого ответа webhook"""
+
+    def __init__(self, handler, workers=8, max_queue=1000, enqueue_timeout=0.5):
+        self.handler = handler
+        self.workers = workers
+        self.enqueue_timeout = enqueue_timeout
+        # Апдейты одного чата всегда попадают в одну очередь и обрабатываются по порядку
+        shard_size = max(1, max_queue // workers)
+        self._queues = [asyncio.Queue(maxsize=shard_size) for _ in range(workers)]
+        self._tasks = []
+        self.is_running = False
+        self.accepted = 0
+        self.processed = 0
+        self.failed = 0
+        self.shed = 0
+        self.in_flight = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def start(self):
+        """Запуск воркеров"""
+        self.is_running = True
+        self._tasks = [
+            asyncio.create_task(self._worker(queue), name=f"update-worker-{index}")
+            for index, queue in enumerate(self._queues)
+        ]
+        logger.info(f"👷 Запущено воркеров: {self.workers}, лимит очереди: {self.max_queue}")
+
+    @property
+    def max_queue(self):
+        return sum(queue.maxsize for queue in self._queues)
+
+    @property
+    def depth(self):
+        return sum(queue.qsize() for queue in self._queues)
+
+    async def submit(self, update):
+        """Постановка апдейта в очередь; False если очередь переполнена (сброс нагрузки)"""
+        if not self.is_running:
+            return False
+        queue = self._queues[hash(get_chat_key(update)) % self.workers]
+        try:
+            queue.put_nowait(update)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(queue.put(update), timeout=self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                self.shed += 1
+                logger.warning(f"⚠️ Очередь апдейтов переполнена, апдейт {update.update_id} отклонен")
+                return False
+        self.accepted += 1
+        return True
+
+    async def _worker(self, queue):
+        while True:
+            update = await queue.get()
+            self.in_flight += 1
+            started = time.perf_counter()
+            try:
+                await self.handler(update)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Ошибка обработки апдейта {update.update_id}: {e}", exc_info=True)
+            finally:
+                elapsed = time.perf_counter() - started
+                self.latency_total += elapsed
+                self.latency_max = max(self.latency_max, elapsed)
+                self.in_flight -= 1
+                queue.task_done()
+
+    def get_stats(self):
+        """Глубина очереди и задержка обработчиков"""
+        handled = self.processed + self.failed
+        return {
+            "depth": self.depth,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "accepted": self.accepted,
+            "processed": self.processed,
+            "failed": self.failed,
+            "shed": self.shed,
+            "latency_avg_ms": round(self.latency_total / handled * 1000, 1) if handled else 0.0,
+            "latency_max_ms": round(self.latency_max * 1000, 1),
+        }
+
+    async def drain(self, timeout):
+        """Прекратить прием и дождаться обработки очереди; возвращает число брошенных апдейтов"""
+        self.is_running = False
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.depth + self.in_flight
+
+    async def stop(self):
+        """Остановка воркеров"""
+        self.is_running = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"🛑 Пул воркеров остановлен. Статистика: {self.get_stats()}")
@@ -0,0 +1,84 @@
+import time
+import asyncio
+import logging
+import threading
+from sqlite_db import open_db
+
+logger = logging.getLogger(__name__)
+
+
+class UserRegistry:
+    """Пользователи, которые запускали бота или оформляли заказ (SQLite, WAL) - адресаты рассылок
+
+    Пользователи, заблокировавшие бота, помечаются blocked_at и в рассылки больше не попадают,
+    пока снова не напишут боту.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    async def start(self):
+        await asyncio.to_thread(self._open)
+        count = await self.count_active()
+        logger.info(f"👥 Реестр пользователей: {count} активных ({self.db_path})")
+
+    def _open(self):
+        self._conn = open_db(self.db_path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            " user_id INTEGER PRIMARY KEY,"
+            " full_name TEXT, username TEXT,"
+            " first_seen REAL NOT NULL,"
+            " last_seen REAL NOT NULL,"
+            " blocked_at REAL)"
+        )
+
+    async def touch(self, user):
+        """Добавить пользователя или обновить время последнего обращения (снимает пометку о блокировке)"""
+        await asyncio.to_thread(self._upsert, user.id, user.full_name, user.username)
+
+    def _upsert(self, user_id, full_name, username):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO users (user_id, full_name, username, first_seen, last_seen) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET full_name = excluded.full_name, "
+                "username = excluded.username, last_seen = excluded.last_seen, blocked_at = NULL",
+                (user_id, full_name, username, now, now)
+            )
+
+    def active_after(self, user_id, limit):
+        """Следующая страница id активных пользователей по возрастанию (вызывается из потока)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id FROM users WHERE user_id > ? AND blocked_at IS NULL ORDER BY user_id LIMIT ?",
+                (user_id, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def count_active_after(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                return self._conn.execute("SELECT COUNT(*) FROM users WHERE blocked_at IS NULL").fetchone()[0]
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM users WHERE user_id > ? AND blocked_at IS NULL", (user_id,)
+            ).fetchone()[0]
+
+    async def count_active(self):
+        return await asyncio.to_thread(self.count_active_after)
+
+    def mark_blocked(self, user_ids):
+        """Пользователи заблокировали бота или удалили аккаунт (вызывается из потока)"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE users SET blocked_at = ? WHERE user_id = ?", [(now, user_id) for user_id in user_ids]
+            )
+
+    async def stop(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+            self._conn = None